@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from django.db.models.signals import post_delete, post_save
+
+        from api.authentication import user_changed
+        from api.handlers import alias_learned
+        from external_api import cities
+
+        post_save.connect(user_changed, sender=get_user_model(), dispatch_uid="api_user_saved")
+        post_delete.connect(user_changed, sender=get_user_model(), dispatch_uid="api_user_deleted")
+        cities.alias_learned.connect(alias_learned, dispatch_uid="api_alias_learned")
@@ -0,0 +1,104 @@
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from external_api.metrics import track_db
+from external_api.timing import phase
+from weather.config import get_config
+
+
+class TimedJWTAuthentication(JWTAuthentication):
+    """
+    JWT-аутентификация с замером длительности (этап auth в Server-Timing)
+    """
+
+    def authenticate(self, request):
+        with phase("auth"):
+            return super().authenticate(request)
+
+
+class UserStatusCache:
+    """
+    Кэш процесса: кому из пользователей разрешена аутентификация.
+    Статус каждого пользователя читается из бд отдельным запросом при первом обращении
+    и хранится AUTH_USERS_CACHE_TIMEOUT секунд (не больше MAX_USERS записей).
+    Отключенные и удаленные пользователи перестают проходить аутентификацию не позже чем через
+    AUTH_USERS_CACHE_TIMEOUT секунд, а в процессе, где они изменены, - сразу
+    """
+
+    MAX_USERS = 100_000
+
+    def __init__(self):
+        self._users: dict[str, tuple[float, bool]] = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, user_id=None) -> None:
+        """
+        Сброс статуса пользователя (или всех пользователей, если user_id не передан)
+        """
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(str(user_id), None)
+
+    def is_active(self, user_id) -> bool:
+        """
+        Может ли пользователь аутентифицироваться (существует и не отключен)
+
+        :param user_id: идентификатор пользователя из токена
+        """
+        user_id = str(user_id)
+        now = time.monotonic()
+        cached = self._users.get(user_id)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        # Запрос к бд выполняется без блокировки: параллельные промахи по одному пользователю
+        # дадут несколько одинаковых запросов, но не остановят аутентификацию остальных
+        active = self._lookup(user_id)
+        with self._lock:
+            if len(self._users) >= self.MAX_USERS:
+                self._evict(now)
+            self._users[user_id] = (now + get_config().auth_users_cache_timeout, active)
+        return active
+
+    def _evict(self, now: float) -> None:
+        self._users = {user_id: entry for user_id, entry in self._users.items() if entry[0] > now}
+        while len(self._users) >= self.MAX_USERS:
+            del self._users[next(iter(self._users))]
+
+    @staticmethod
+    def _lookup(user_id: str) -> bool:
+        with track_db("auth_user"):
+            return get_user_model().objects.filter(
+                **{api_settings.USER_ID_FIELD: user_id}, is_active=True
+            ).exists()
+
+
+user_status = UserStatusCache()
+
+
+def user_changed(sender, instance, **kwargs) -> None:
+    """
+    Сброс закэшированного статуса пользователя при его изменении или удалении
+    """
+    user_status.invalidate(getattr(instance, api_settings.USER_ID_FIELD))
+
+
+class StatelessJWTAuthentication(TimedJWTAuthentication, JWTStatelessUserAuthentication):
+    """
+    JWT-аутентификация только по данным токена, без чтения пользователя из бд на каждый запрос.
+    request.user - TokenUser; отключенные и удаленные пользователи отсекаются по кэшу UserStatusCache
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if not user_status.is_active(user.id):
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
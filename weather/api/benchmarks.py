@@ -0,0 +1,307 @@
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import timeit
+import uuid
+from collections.abc import Callable, Iterable
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+from django.http import QueryDict
+from django.test import Client
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.renderers import FastJSONRenderer
+from api.serializers import ForecastGetSerializer, QueryValidator
+
+CURRENT_URL = "/api/weather/current"
+FORECAST_URL = "/api/weather/forecast"
+
+# Доля запросов к популярным городам в смешанной нагрузке
+MIXED_HOT_SHARE = 0.8
+# Количество дней в ответе при сравнении рендереров
+DEFAULT_RANGE_DAYS = 5
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """
+    Перцентиль методом ближайшего ранга
+
+    :param values: отсортированные значения
+    :param percent: от 0 до 100
+    """
+    if not values:
+        return 0.0
+    rank = max(1, round(percent / 100 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+def _auth_header() -> str:
+    user, _ = User.objects.get_or_create(username="benchmark")
+    return f"Bearer {AccessToken.for_user(user)}"
+
+
+def _host() -> str:
+    hosts = [host for host in settings.ALLOWED_HOSTS if host != "*" and not host.startswith(".")]
+    return hosts[0] if hosts else "localhost"
+
+
+def run_workload(send: Callable[[Client, tuple], int], specs: Iterable[tuple], concurrency: int) -> dict:
+    """
+    Выполнение запросов в concurrency потоках
+
+    :param send: функция (клиент, параметры запроса) -> статус ответа
+    :param specs: параметры запросов
+    :return: dict: количество запросов и ошибок, пропускная способность и задержки в мс
+    """
+    auth = _auth_header()
+    host = _host()
+    specs = iter(specs)
+    lock = threading.Lock()
+    latencies, errors = [], 0
+
+    def worker():
+        nonlocal errors
+        client = Client(HTTP_AUTHORIZATION=auth, HTTP_HOST=host)
+        try:
+            while True:
+                with lock:
+                    spec = next(specs, None)
+                if spec is None:
+                    return
+
+                started = time.perf_counter()
+                status = send(client, spec)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    errors += status >= 400
+        finally:
+            connections.close_all()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "duration": round(duration, 4),
+        "throughput": round(len(latencies) / duration, 2) if duration else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def _get_current(client: Client, spec: tuple) -> int:
+    return client.get(CURRENT_URL, {"city": spec[0]}).status_code
+
+
+def _get_forecast(client: Client, spec: tuple) -> int:
+    return client.get(FORECAST_URL, {"city": spec[0], "date": spec[1]}).status_code
+
+
+def _post_forecast(client: Client, spec: tuple) -> int:
+    city, day, temperature = spec
+    return client.post(FORECAST_URL, {
+        "city": city,
+        "date": day,
+        "min_temperature": temperature,
+        "max_temperature": temperature + 5,
+    }, content_type="application/json").status_code
+
+
+class WeatherBenchmark:
+    """
+    Набор нагрузочных сценариев для эндпоинтов текущей погоды и прогноза.
+    Популярные города (hot) прогреваются заранее, для холодных (cold) каждое название используется один раз
+
+    :param hot_cities: популярные города
+    :param requests: количество запросов в сценарии
+    :param concurrency: количество параллельных клиентов
+    :param seed: зерно генератора для повторяемости последовательности запросов
+    """
+
+    workloads = (
+        "current_hot", "current_cold", "current_mixed",
+        "forecast_hot", "forecast_cold", "forecast_mixed",
+        "forecast_post",
+    )
+
+    def __init__(self, hot_cities: list[str], requests: int, concurrency: int, seed: int = 0):
+        self.hot_cities = hot_cities
+        self.requests = requests
+        self.concurrency = concurrency
+        self.random = random.Random(seed)
+        # Уникальный префикс, чтобы холодные города не были в кэше и бд после прошлых запусков
+        self.run_id = uuid.uuid4().hex[:8]
+        self.day = (timezone.now().date() + timedelta(days=1)).strftime("%d.%m.%Y")
+        self._cold_count = 0
+
+    def _cold_city(self) -> str:
+        self._cold_count += 1
+        return f"bench-{self.run_id}-{self._cold_count}"
+
+    def _cities(self, workload: str) -> list[str]:
+        if workload.endswith("_hot"):
+            return [self.random.choice(self.hot_cities) for _ in range(self.requests)]
+        if workload.endswith("_cold"):
+            return [self._cold_city() for _ in range(self.requests)]
+        return [
+            self.random.choice(self.hot_cities) if self.random.random() < MIXED_HOT_SHARE else self._cold_city()
+            for _ in range(self.requests)
+        ]
+
+    def warm_up(self) -> None:
+        """
+        Прогрев кэша для популярных городов
+        """
+        run_workload(_get_current, [(city,) for city in self.hot_cities], self.concurrency)
+        run_workload(_get_forecast, [(city, self.day) for city in self.hot_cities], self.concurrency)
+
+    def run(self, workload: str) -> dict:
+        """
+        Выполнение сценария
+
+        :param workload: название из WeatherBenchmark.workloads
+        :return: результат run_workload
+        """
+        if workload == "forecast_post":
+            specs = [
+                (self._cold_city(), self.day, round(self.random.uniform(-20, 30), 1))
+                for _ in range(self.requests)
+            ]
+            return run_workload(_post_forecast, specs, self.concurrency)
+
+        cities = self._cities(workload)
+        if workload.startswith("current_"):
+            return run_workload(_get_current, [(city,) for city in cities], self.concurrency)
+        return run_workload(_get_forecast, [(city, self.day) for city in cities], self.concurrency)
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Сравнение результатов с базовым отчетом
+
+    :param results: results текущего отчета
+    :param baseline: results базового отчета
+    :param threshold: допустимое ухудшение, доля (0.1 - 10%)
+    :return: список описаний регрессий
+    """
+    regressions = []
+    for workload, current in results.items():
+        previous = baseline.get(workload)
+        if previous is None:
+            continue
+
+        if previous["throughput"] and current["throughput"] < previous["throughput"] * (1 - threshold):
+            regressions.append(
+                f"{workload}: пропускная способность {previous['throughput']} -> {current['throughput']} запр/с"
+            )
+        for metric in ("p95_ms", "p99_ms"):
+            if previous[metric] and current[metric] > previous[metric] * (1 + threshold):
+                regressions.append(f"{workload}: {metric} {previous[metric]} -> {current[metric]}")
+    return regressions
+
+
+def _per_call_us(func: Callable[[], object], number: int, repeat: int = 3) -> float:
+    best = min(timeit.repeat(func, number=number, repeat=repeat))
+    return round(best / number * 1_000_000, 3)
+
+
+def compare_fast_paths(number: int = 10000) -> dict:
+    """
+    Сравнение быстрых путей (QueryValidator, FastJSONRenderer) с сериализаторами и JSON-рендерером DRF
+    на типичных запросах прогноза
+
+    :param number: количество вызовов в замере
+    :return: dict: {"validation": {"drf_us": 41.2, "fast_us": 3.1, "speedup": 13.3}, "render": {...}}
+    """
+    day = (timezone.now().date() + timedelta(days=1)).strftime("%d.%m.%Y")
+    params = QueryDict(mutable=True)
+    params.update({"city": "Moscow", "date": day})
+    validator = QueryValidator(ForecastGetSerializer, ("date",))
+    payload = [
+        {"date": (timezone.now().date() + timedelta(days=offset)).strftime("%Y-%m-%d"),
+         "min_temperature": 11.1 + offset, "max_temperature": 24.5 + offset}
+        for offset in range(DEFAULT_RANGE_DAYS)
+    ]
+    drf_renderer, fast_renderer = JSONRenderer(), FastJSONRenderer()
+
+    def drf_validation():
+        serializer = ForecastGetSerializer(data=params)
+        serializer.is_valid()
+        return serializer.validated_data
+
+    cases = {
+        "validation": (drf_validation, lambda: validator.validate(params)),
+        "render": (lambda: drf_renderer.render(payload), lambda: fast_renderer.render(payload)),
+    }
+    results = {}
+    for name, (drf_path, fast_path) in cases.items():
+        drf_us, fast_us = _per_call_us(drf_path, number), _per_call_us(fast_path, number)
+        speedup = round(drf_us / fast_us, 1) if fast_us else None
+        results[name] = {"drf_us": drf_us, "fast_us": fast_us, "speedup": speedup}
+    return results
+
+
+# Импорты, выполняемые воркером при запуске
+STARTUP_SCRIPT = (
+    "import django; django.setup(); "
+    "import weather.urls, weather.wsgi"
+)
+
+
+def parse_importtime(output: str) -> dict[str, dict]:
+    """
+    Разбор вывода python -X importtime
+
+    :return: dict: {"api.views": {"self_us": 120, "cumulative_us": 35000}}
+    """
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = [part.strip() for part in line.removeprefix("import time:").split("|")]
+        if len(parts) != 3 or not parts[0].isdigit():
+            continue
+        modules[parts[2]] = {"self_us": int(parts[0]), "cumulative_us": int(parts[1])}
+    return modules
+
+
+def measure_startup(script: str = STARTUP_SCRIPT) -> dict:
+    """
+    Замер запуска процесса с импортом Django, настроек и маршрутов в отдельном интерпретаторе
+
+    :return: dict: {"wall_ms": 850.1, "interpreter_ms": 15.2, "modules": parse_importtime(...)}
+    """
+    env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "weather.settings")}
+
+    def run(*args) -> tuple[float, str]:
+        started = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, *args], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR, env=env
+        )
+        return (time.perf_counter() - started) * 1000, process.stderr
+
+    interpreter_ms, _ = run("-c", "pass")
+    wall_ms, output = run("-X", "importtime", "-c", script)
+    return {
+        "wall_ms": round(wall_ms, 1),
+        "interpreter_ms": round(interpreter_ms, 1),
+        "modules": parse_importtime(output),
+    }
@@ -0,0 +1,73 @@
+import hashlib
+import time
+
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+from external_api.cities import city_key
+from external_api.decorators import cache_info
+from weather.config import get_config
+
+
+def make_etag(*parts) -> str:
+    """
+    Слабый ETag из версии данных (ключ города, дата, время получения данных из API и т.п.)
+    """
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def not_modified(request, etag: str | None) -> bool:
+    """
+    Проверка заголовка If-None-Match (слабое сравнение)
+    """
+    header = request.headers.get("If-None-Match")
+    if not header or etag is None:
+        return False
+    if header.strip() == "*":
+        return True
+
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def with_validators(response: Response, etag: str | None, max_age: float) -> Response:
+    """
+    Заголовки ETag, Cache-Control и Expires по оставшемуся времени жизни данных в кэше.
+    Ответ не меняется, если версия данных неизвестна
+    """
+    if etag is None:
+        return response
+
+    max_age = max(0, int(max_age))
+    scope = "public" if get_config().http_cache_public else "private"
+    response["ETag"] = etag
+    response["Cache-Control"] = f"{scope}, max-age={max_age}"
+    response["Expires"] = http_date(time.time() + max_age)
+    patch_vary_headers(response, ("Authorization",))
+    return response
+
+
+def not_modified_response(etag: str, max_age: float) -> Response:
+    """
+    Ответ 304 с заголовками кэширования
+    """
+    return with_validators(Response(status=status.HTTP_304_NOT_MODIFIED), etag, max_age)
+
+
+def cache_validators(prefix: str, city: str, *parts) -> tuple[str | None, float]:
+    """
+    ETag и оставшееся время жизни для данных, закэшированных cached_data
+
+    :param prefix: префикс ключа кэша (например, "daily_forecast")
+    :param city: название города
+    :param parts: дополнительные части версии ответа (дата, данные из бд)
+    :return: (ETag, секунды) или (None, 0), если данных в кэше нет или они устарели
+    """
+    info = cache_info(prefix, city)
+    # Устаревшая запись отдается через клиент: только он запускает ее обновление в фоне
+    if info is None or info["fresh_for"] <= 0:
+        return None, 0
+    return make_etag(prefix, city_key(city), info["version"], *parts), info["fresh_for"]
@@ -1,6 +1,29 @@
-from datetime import datetime
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 
+from django.db import close_old_connections, transaction
+
+from api.index import hand_forecast_index
 from api.models import HandForecasts
+from api.response_cache import invalidate_cities
+from api.serializers import HandForecastUpdateSerializer
+from external_api.cities import cities_not_found, city_key, city_keys
+from external_api.geocoding import get_cached_locations
+from external_api.metrics import track_db
+from external_api.openweathermap_client import OpenWeatherClient, OpenWeatherClientError
+from external_api.worldtime_client import CityTimeCityNotFoundError, CityTimeClient, CityTimeClientError
+from weather.config import get_config
+
+_batch_executor = ThreadPoolExecutor(
+    max_workers=get_config().batch_workers,
+    thread_name_prefix="weather-batch"
+)
+# Отдельный пул для запросов одного города: пачки городов не занимают его потоки
+_current_executor = ThreadPoolExecutor(
+    max_workers=get_config().current_weather_workers,
+    thread_name_prefix="weather-current"
+)
 
 
 class HandForecastsHandler:
@@ -11,12 +34,19 @@ class HandForecastsHandler:
     @staticmethod
     def get_forecast(city: str, date: datetime) -> dict | None:
         """
-        Метод для получения прогноза погоды из бд
+        Метод для получения прогноза погоды из бд.
+        Город ищется по каноническому ключу, поэтому находятся прогнозы, сохраненные под любым написанием
         :param city:
         :param date:
         :return: dict or None
         """
-        forcast = HandForecasts.objects.filter(city=city, date=date).first()
+        keys = city_keys(city)
+        if not hand_forecast_index.might_exist(keys, [date]):
+            return None
+
+        with track_db("get_forecast"):
+            forecasts = list(HandForecasts.objects.filter(city_key__in=keys, date=date))
+        forcast = min(forecasts, key=lambda item: keys.index(item.city_key), default=None)
         if forcast:
             formated_data = {
                             "min_temperature": forcast.min_temperature,
@@ -24,3 +54,220 @@ class HandForecastsHandler:
             return formated_data
 
         return None
+
+    @staticmethod
+    def get_forecasts(city: str, date_from: date, date_to: date) -> dict[date, dict]:
+        """
+        Метод для получения прогнозов погоды из бд за период одним запросом
+        :param city:
+        :param date_from: начало периода (включительно)
+        :param date_to: конец периода (включительно)
+        :return: dict: {date: {"min_temperature": 11.1, "max_temperature": 24.5}}
+        """
+        keys = city_keys(city)
+        days = [date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+        if not hand_forecast_index.might_exist(keys, days):
+            return {}
+
+        with track_db("get_forecasts"):
+            forecasts = list(HandForecasts.objects.filter(
+                city_key__in=keys, date__range=(date_from, date_to)
+            ).order_by("date"))
+
+        result = {}
+        # Записи с каноническим ключом перекрывают записи, сохраненные по названию города
+        for forcast in sorted(forecasts, key=lambda item: keys.index(item.city_key), reverse=True):
+            result[forcast.date] = {
+                "min_temperature": forcast.min_temperature,
+                "max_temperature": forcast.max_temperature}
+        return result
+
+    @staticmethod
+    def save_forecast(city: str, date: datetime, min_temperature: float, max_temperature: float) -> bool:
+        """
+        Метод для сохранения прогноза погоды в бд
+        :return: True, если прогноз создан, False, если обновлен
+        """
+        with track_db("save_forecast"):
+            forecast, created = HandForecasts.objects.update_or_create(
+                city_key=city_key(city),
+                date=date,
+                defaults={
+                    'city': city,
+                    'min_temperature': min_temperature,
+                    'max_temperature': max_temperature
+                }
+            )
+        invalidate_cities([city])
+        return created
+
+    @staticmethod
+    def move_alias(alias: str, city_key: str) -> int:
+        """
+        Перенос прогнозов, сохраненных по названию города (ключ alias), на канонический ключ города.
+        Если на дату уже есть прогноз с каноническим ключом, остается он
+        :return: количество перенесенных прогнозов
+        """
+        with track_db("move_alias"), transaction.atomic():
+            taken = HandForecasts.objects.filter(city_key=city_key).values_list("date", flat=True)
+            HandForecasts.objects.filter(city_key=alias, date__in=taken).delete()
+            days = list(HandForecasts.objects.filter(city_key=alias).values_list("date", flat=True))
+            HandForecasts.objects.filter(city_key=alias).update(city_key=city_key)
+
+        if days:
+            hand_forecast_index.add((city_key, day) for day in days)
+            invalidate_cities([alias])
+        return len(days)
+
+    @staticmethod
+    def import_forecasts(rows, batch_size: int = 1000, max_errors: int = 100) -> dict:
+        """
+        Метод для массовой загрузки прогнозов погоды в бд.
+        Строки проверяются по правилам HandForecastUpdateSerializer и записываются пачками
+        через INSERT ... ON CONFLICT (city_key, date) DO UPDATE
+        :param rows: итерируемый набор словарей с ключами city, date, min_temperature, max_temperature
+        :param batch_size: размер пачки для записи в бд
+        :param max_errors: максимальное количество ошибок в ответе
+        :return: dict: {"imported": 120, "errors_total": 1, "errors": [{"row": 3, "errors": {...}}]}
+        """
+        imported = 0
+        errors_total = 0
+        errors = []
+        batch = {}
+
+        for number, row in enumerate(rows, start=1):
+            serializer = HandForecastUpdateSerializer(data=row)
+            if not serializer.is_valid():
+                errors_total += 1
+                if len(errors) < max_errors:
+                    errors.append({"row": number, "errors": serializer.errors})
+                continue
+
+            data = serializer.validated_data
+            forecast = HandForecasts(
+                city=data["city"],
+                city_key=city_key(data["city"]),
+                date=data["date"],
+                min_temperature=data["min_temperature"],
+                max_temperature=data["max_temperature"]
+            )
+            # Повтор пары (город, дата) внутри пачки заменяет предыдущую строку
+            batch[(forecast.city_key, forecast.date)] = forecast
+            if len(batch) >= batch_size:
+                imported += HandForecastsHandler._write_batch(list(batch.values()))
+                batch = {}
+
+        if batch:
+            imported += HandForecastsHandler._write_batch(list(batch.values()))
+
+        return {"imported": imported, "errors_total": errors_total, "errors": errors}
+
+    @staticmethod
+    def _write_batch(forecasts: list[HandForecasts]) -> int:
+        with track_db("import_batch"), transaction.atomic():
+            HandForecasts.objects.bulk_create(
+                forecasts,
+                update_conflicts=True,
+                unique_fields=["city_key", "date"],
+                update_fields=["city", "min_temperature", "max_temperature"]
+            )
+        hand_forecast_index.add((forecast.city_key, forecast.date) for forecast in forecasts)
+        invalidate_cities(forecast.city for forecast in forecasts)
+        return len(forecasts)
+
+
+def alias_learned(sender, alias: str, city_key: str, **kwargs) -> None:
+    """
+    Перенос прогнозов при появлении нового написания известного города (external_api.cities.alias_learned)
+    """
+    HandForecastsHandler.move_alias(alias, city_key)
+
+
+def _submit(executor: ThreadPoolExecutor, func, *args) -> Future:
+    """
+    Запуск функции в пуле потоков с контекстом текущего запроса (этапы Server-Timing)
+    """
+    context = contextvars.copy_context()
+
+    def run():
+        try:
+            return context.run(func, *args)
+        finally:
+            close_old_connections()
+
+    return executor.submit(run)
+
+
+class CurrentWeatherHandler:
+    """
+    Класс для получения текущей погоды одного города
+    """
+
+    @staticmethod
+    def get_current_weather(city: str) -> tuple[float, str]:
+        """
+        Параллельный запрос температуры и локального времени города.
+        Температура запрашивается в потоке запроса (ее видит профилировщик), время - в пуле _current_executor.
+        Ошибки пробрасываются в порядке запросов: сначала OpenWeather, затем WorldTime
+        :param city: название города
+        :return: (температура, локальное время)
+        """
+        local_time = _submit(_current_executor, CityTimeClient().get_time, city)
+        try:
+            temperature = OpenWeatherClient().get_current_weather(city)
+        finally:
+            # Ответ WorldTime дожидается и при ошибке OpenWeather, чтобы поток не продолжал работу после ответа
+            time_error = local_time.exception()
+        if time_error is not None:
+            raise time_error
+        return temperature, local_time.result()
+
+
+class CurrentWeatherBatchHandler:
+    """
+    Класс для получения текущей погоды сразу для нескольких городов
+    """
+
+    @staticmethod
+    def get_current_weather(cities: list[str]) -> dict:
+        """
+        Метод для получения температуры и локального времени списка городов.
+        Закэшированные температуры, координаты и отметки "город не найден" читаются из кэша пачками,
+        промахи загружаются параллельно
+        :param cities: список городов
+        :return: dict: {
+                        "results": {"Moscow": {"temperature": 21.5, "local_time": "14:00"}},
+                        "errors": {"Nowhere": "Ошибка работы с API OpenWeather - ..."}
+                        }
+        """
+        cities = list(dict.fromkeys(cities))
+        weather_client = OpenWeatherClient()
+        time_client = CityTimeClient()
+        cached = weather_client.get_cached_current_weather(cities)
+        locations = get_cached_locations(cities)
+        not_found = cities_not_found([city for city in cities if city not in locations], "geocoding")
+
+        def fetch(city):
+            try:
+                temperature = cached[city] if city in cached else weather_client.get_current_weather(city)
+                if city in not_found:
+                    raise CityTimeCityNotFoundError(f"Город '{city}' не найден.")
+                local_time = time_client.get_time(city, locations.get(city))
+                return {"temperature": temperature, "local_time": local_time}, None
+            except OpenWeatherClientError as e:
+                return None, f"Ошибка работы с API OpenWeather - {e}"
+            except CityTimeClientError as e:
+                return None, f"Ошибка работы с API WorldTime - {e}"
+            except Exception as e:
+                return None, str(e)
+            finally:
+                close_old_connections()
+
+        results, errors = {}, {}
+        for city, (data, error) in zip(cities, _batch_executor.map(fetch, cities)):
+            if error is None:
+                results[city] = data
+            else:
+                errors[city] = error
+
+        return {"results": results, "errors": errors}
@@ -0,0 +1,221 @@
+import logging
+import threading
+import time
+import uuid
+from collections.abc import Iterable
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from redis.exceptions import LockError
+
+from weather.config import get_config
+
+logger = logging.getLogger('cache_logger')
+
+INDEX_KEY = "hand_forecasts:index"
+# Имя временного множества идущего перестроения
+BUILD_KEY = "hand_forecasts:index:build"
+READY_KEY = "hand_forecasts:index:ready"
+LOCK_KEY = "lock:hand_forecasts:index"
+# Время жизни временного множества и блокировки перестроения, секунды
+BUILD_TIMEOUT = 600
+
+# Добавление в индекс и во временное множество идущего перестроения (атомарно относительно его завершения)
+_ADD_SCRIPT = """
+redis.call('SADD', KEYS[1], unpack(ARGV, 2))
+local building = redis.call('GET', KEYS[2])
+if building then
+    redis.call('SADD', building, unpack(ARGV, 2))
+    redis.call('EXPIRE', building, ARGV[1])
+end
+"""
+
+# Замена индекса построенным множеством
+_FINISH_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('RENAME', KEYS[1], KEYS[2])
+else
+    redis.call('DEL', KEYS[2])
+end
+if redis.call('GET', KEYS[3]) == KEYS[1] then
+    redis.call('DEL', KEYS[3])
+end
+redis.call('SET', KEYS[4], 1, 'EX', ARGV[1])
+"""
+
+
+def _member(city_key: str, day: date | str) -> str:
+    return f"{city_key}:{day}"
+
+
+class HandForecastIndex:
+    """
+    Индекс пар (город, дата), для которых есть прогноз, сохраненный вручную.
+    Позволяет не обращаться к бд, если прогноза заведомо нет.
+    Хранится в множестве Redis, без Redis - в памяти процесса (подходит только для одного процесса).
+    Индекс перестраивается из бд при первом обращении процесса и раз в HAND_FORECAST_INDEX_TTL секунд
+    одним процессом (блокировка Redis). Пока индекс недоступен, считается, что прогноз может быть.
+    Если запись в индекс не удалась, индекс помечается непостроенным и перестраивается при следующем обращении
+    """
+
+    def __init__(self):
+        self._local: set[str] = set()
+        self._checked_at = None
+        # Запись в индекс не удалась: индексу нельзя доверять до перестроения
+        self._missed_add = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _redis():
+        if not settings.CACHES["default"]["BACKEND"].startswith("django_redis"):
+            return None
+
+        from django_redis import get_redis_connection
+        return get_redis_connection("default")
+
+    @staticmethod
+    def _ttl() -> int:
+        return get_config().hand_forecast_index_ttl
+
+    def _checked_recently(self, now: float) -> bool:
+        return self._checked_at is not None and now - self._checked_at < 60
+
+    def _ensure_built(self, redis) -> bool:
+        """
+        Перестроение индекса, если истек срок его актуальности
+
+        :return: False, если индексом пользоваться нельзя (не построен или перестроение не удалось)
+        """
+        now = time.monotonic()
+        if self._checked_recently(now):
+            return True
+
+        with self._lock:
+            if self._checked_recently(now):
+                return True
+            try:
+                if self._missed_add:
+                    ready = False
+                else:
+                    ready = redis.exists(READY_KEY) if redis is not None else self._checked_at is not None
+                if not ready and self.rebuild() is None:
+                    # Индекс перестраивает другой процесс: до этого годится прежний, если он есть
+                    # и в него не пропала запись этого процесса
+                    return not self._missed_add and bool(redis.exists(INDEX_KEY))
+            except Exception as e:
+                logger.warning(f"Не удалось перестроить индекс прогнозов: {e}")
+                return False
+            self._missed_add = False
+            self._checked_at = now
+            return True
+
+    def might_exist(self, city_keys: list[str], days: Iterable[date]) -> bool:
+        """
+        Проверка, может ли в бд быть прогноз для города хотя бы на один из дней
+
+        :param city_keys: ключи города (external_api.cities.city_keys)
+        :param days: даты
+        :return: False, если прогноза точно нет
+        """
+        members = [_member(key, day) for key in city_keys for day in days]
+        redis = self._redis()
+        if not self._ensure_built(redis):
+            return True
+
+        if redis is None:
+            return any(member in self._local for member in members)
+
+        try:
+            pipeline = redis.pipeline(transaction=False)
+            for member in members:
+                pipeline.sismember(INDEX_KEY, member)
+            return any(pipeline.execute())
+        except Exception as e:
+            logger.warning(f"Индекс прогнозов недоступен: {e}")
+            return True
+
+    def add(self, items: Iterable[tuple[str, date | str]]) -> None:
+        """
+        Добавление пар (ключ города, дата) в индекс
+        """
+        members = [_member(key, day) for key, day in items]
+        if not members:
+            return
+
+        redis = self._redis()
+        if redis is None:
+            self._local.update(members)
+            return
+
+        try:
+            # Идущее перестроение индекса не должно потерять новые записи
+            redis.eval(_ADD_SCRIPT, 2, INDEX_KEY, BUILD_KEY, BUILD_TIMEOUT, *members)
+        except Exception as e:
+            # Запись в бд уже сохранена: без нее в индексе прогноз был бы скрыт до перестроения,
+            # поэтому индекс помечается непостроенным во всех процессах (READY_KEY) и в этом процессе
+            logger.warning(f"Не удалось добавить прогнозы в индекс, индекс будет перестроен: {e}")
+            self._missed_add = True
+            self._checked_at = None
+            try:
+                redis.delete(READY_KEY)
+            except Exception as e:
+                logger.warning(f"Не удалось сбросить признак готовности индекса: {e}")
+
+    def rebuild(self, batch_size: int = 5000) -> int | None:
+        """
+        Перестроение индекса по данным бд.
+        Множество строится под уникальным ключом и атомарно заменяет индекс
+
+        :return: количество записей в индексе или None, если индекс уже перестраивает другой процесс
+        """
+        from api.models import HandForecasts
+
+        rows = HandForecasts.objects.values_list("city_key", "date").iterator(chunk_size=batch_size)
+        redis = self._redis()
+        if redis is None:
+            self._local = {_member(key, day) for key, day in rows}
+            self._checked_at = time.monotonic()
+            return len(self._local)
+
+        lock = cache.lock(LOCK_KEY, timeout=BUILD_TIMEOUT)
+        if not lock.acquire(blocking=False):
+            return None
+
+        build_key = f"{BUILD_KEY}:{uuid.uuid4().hex}"
+        try:
+            redis.set(BUILD_KEY, build_key, ex=BUILD_TIMEOUT)
+            total = 0
+            batch = []
+            for key, day in rows:
+                batch.append(_member(key, day))
+                if len(batch) >= batch_size:
+                    self._add_to_build(redis, build_key, batch)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                self._add_to_build(redis, build_key, batch)
+                total += len(batch)
+
+            redis.eval(_FINISH_SCRIPT, 4, build_key, INDEX_KEY, BUILD_KEY, READY_KEY, self._ttl())
+        except Exception:
+            redis.delete(build_key)
+            raise
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                pass
+
+        logger.info(f"Индекс прогнозов перестроен: {total}")
+        return total
+
+    @staticmethod
+    def _add_to_build(redis, build_key: str, members: list[str]) -> None:
+        pipeline = redis.pipeline(transaction=False)
+        pipeline.sadd(build_key, *members)
+        pipeline.expire(build_key, BUILD_TIMEOUT)
+        pipeline.execute()
+
+
+hand_forecast_index = HandForecastIndex()
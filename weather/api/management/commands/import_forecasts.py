@@ -0,0 +1,41 @@
+import csv
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.handlers import HandForecastsHandler
+
+
+class Command(BaseCommand):
+    """
+    Массовая загрузка прогнозов погоды из файла.
+    Поддерживаются CSV (колонки city, date, min_temperature, max_temperature) и JSON (список объектов с теми же полями)
+    """
+
+    help = "Массовая загрузка прогнозов погоды из CSV или JSON файла"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path, help="Путь к файлу .csv или .json")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Размер пачки для записи в бд")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not path.exists():
+            raise CommandError(f"Файл {path} не найден")
+
+        with path.open(encoding="utf-8-sig") as file:
+            if path.suffix == ".json":
+                rows = json.load(file)
+            elif path.suffix == ".csv":
+                rows = csv.DictReader(file)
+            else:
+                raise CommandError("Поддерживаются только файлы .csv и .json")
+
+            result = HandForecastsHandler.import_forecasts(rows, batch_size=options["batch_size"])
+
+        for error in result["errors"]:
+            self.stderr.write(f"Строка {error['row']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Загружено прогнозов: {result['imported']}, строк с ошибками: {result['errors_total']}"
+        ))
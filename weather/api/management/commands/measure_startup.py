@@ -0,0 +1,42 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from api.benchmarks import STARTUP_SCRIPT, measure_startup
+
+
+class Command(BaseCommand):
+    """
+    Замер времени запуска воркера: импорт Django, настроек, приложений и маршрутов
+    в отдельном интерпретаторе (python -X importtime) с разбивкой по модулям
+    """
+
+    help = "Время запуска процесса и стоимость импорта модулей"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=25, help="Количество самых дорогих модулей в выводе")
+        parser.add_argument("--prefix", action="append", help="Показывать только модули с префиксом (например, api)")
+        parser.add_argument("--script", default=STARTUP_SCRIPT, help="Код, выполняемый при запуске")
+        parser.add_argument("--json", action="store_true", help="Вывести результат в JSON")
+
+    def handle(self, *args, **options):
+        result = measure_startup(options["script"])
+        modules = result["modules"]
+        if options["prefix"]:
+            modules = {
+                name: timing for name, timing in modules.items()
+                if any(name == prefix or name.startswith(f"{prefix}.") for prefix in options["prefix"])
+            }
+        top = sorted(modules.items(), key=lambda item: item[1]["cumulative_us"], reverse=True)[:options["top"]]
+
+        if options["json"]:
+            self.stdout.write(json.dumps({**result, "modules": dict(top)}, indent=2))
+            return
+
+        self.stdout.write(
+            f"Запуск: {result['wall_ms']} мс (пустой интерпретатор {result['interpreter_ms']} мс), "
+            f"модулей импортировано: {len(result['modules'])}"
+        )
+        self.stdout.write(f"{'всего, мс':>10} {'свое, мс':>9}  модуль")
+        for name, timing in top:
+            self.stdout.write(f"{timing['cumulative_us'] / 1000:>10.1f} {timing['self_us'] / 1000:>9.1f}  {name}")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api.index import hand_forecast_index
+
+
+class Command(BaseCommand):
+    """
+    Перестроение индекса прогнозов, сохраненных вручную
+    """
+
+    help = "Перестроение индекса (город, дата) прогнозов, сохраненных вручную"
+
+    def handle(self, *args, **options):
+        total = hand_forecast_index.rebuild()
+        if total is None:
+            self.stdout.write(self.style.WARNING("Индекс уже перестраивается другим процессом"))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Записей в индексе: {total}"))
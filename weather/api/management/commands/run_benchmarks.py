@@ -0,0 +1,153 @@
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from api.benchmarks import WeatherBenchmark, compare
+from external_api.fake_upstream import CITIES, FakeUpstreamServer
+from weather.config import reload_config
+
+LOCAL_HOSTS = {"", "localhost", "127.0.0.1", "::1"}
+LOCAL_CACHE_BACKENDS = ("LocMemCache", "DummyCache", "FileBasedCache")
+
+# Префикс ключей кэша на время запуска: данные локальных внешних API не попадают к пользователям
+CACHE_KEY_PREFIX = "benchmark"
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=settings.BASE_DIR
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _is_local_cache(config: dict) -> bool:
+    if config["BACKEND"].endswith(LOCAL_CACHE_BACKENDS):
+        return True
+    locations = config.get("LOCATION", "")
+    if isinstance(locations, str):
+        locations = locations.split(",")
+    for location in locations:
+        location = location.strip()
+        parts = urlsplit(location if "://" in location else f"//{location}")
+        if parts.scheme != "unix" and (parts.hostname or "") not in LOCAL_HOSTS:
+            return False
+    return True
+
+
+def _is_local_db(config: dict) -> bool:
+    if "sqlite3" in (config.get("ENGINE") or ""):
+        return True
+    host = config.get("HOST") or ""
+    return host in LOCAL_HOSTS or host.startswith("/")
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочное тестирование эндпоинтов текущей погоды и прогноза.
+    Внешние API по умолчанию заменяются локальным сервером (external_api.fake_upstream),
+    кэш и бд используются из настроек проекта, если они локальные; ключи кэша пишутся с отдельным префиксом
+    """
+
+    help = "Замер пропускной способности и задержек эндпоинтов погоды с отчетом в JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workload", action="append", choices=WeatherBenchmark.workloads,
+            help="Сценарий (можно указать несколько раз), по умолчанию все"
+        )
+        parser.add_argument("--requests", type=int, default=500, help="Количество запросов в сценарии")
+        parser.add_argument("--concurrency", type=int, default=8, help="Количество параллельных клиентов")
+        parser.add_argument("--seed", type=int, default=0, help="Зерно генератора последовательности запросов")
+        parser.add_argument("--latency", type=float, default=0.05, help="Задержка локальных внешних API, секунды")
+        parser.add_argument(
+            "--real-upstream", action="store_true",
+            help="Использовать внешние API из настроек вместо локального сервера"
+        )
+        parser.add_argument("--output", type=Path, help="Путь для сохранения отчета в JSON")
+        parser.add_argument("--baseline", type=Path, help="Отчет для сравнения")
+        parser.add_argument("--threshold", type=float, default=0.1, help="Допустимое ухудшение, доля")
+
+    def handle(self, *args, **options):
+        # Сценарии пишут в кэш данные локальных внешних API, а в бд прогнозы bench-*
+        if not _is_local_cache(settings.CACHES["default"]):
+            raise CommandError("Кэш в настройках не локальный, нагрузочное тестирование запрещено")
+        if not _is_local_db(settings.DATABASES["default"]):
+            raise CommandError("Бд в настройках не локальная, нагрузочное тестирование запрещено")
+
+        baseline = None
+        if options["baseline"]:
+            if not options["baseline"].exists():
+                raise CommandError(f"Файл {options['baseline']} не найден")
+            baseline = json.loads(options["baseline"].read_text(encoding="utf-8"))
+
+        upstream = None
+        if not options["real_upstream"]:
+            upstream = FakeUpstreamServer(("127.0.0.1", 0), latency=options["latency"])
+            upstream.start()
+            os.environ.update(upstream.env())
+            reload_config()
+
+        benchmark = WeatherBenchmark(
+            hot_cities=[city[1] for city in CITIES],
+            requests=options["requests"],
+            concurrency=options["concurrency"],
+            seed=options["seed"],
+        )
+        caches = {
+            alias: {**config, "KEY_PREFIX": CACHE_KEY_PREFIX}
+            for alias, config in settings.CACHES.items()
+        }
+        results = {}
+        try:
+            with override_settings(CACHES=caches):
+                benchmark.warm_up()
+                for workload in options["workload"] or WeatherBenchmark.workloads:
+                    results[workload] = result = benchmark.run(workload)
+                    self.stdout.write(
+                        f"{workload:<16} {result['throughput']:>9} запр/с  "
+                        f"p50 {result['p50_ms']:>8} мс  p95 {result['p95_ms']:>8} мс  "
+                        f"p99 {result['p99_ms']:>8} мс  ошибок {result['errors']}"
+                    )
+        finally:
+            if upstream is not None:
+                upstream.shutdown()
+                upstream.server_close()
+
+        report = {
+            "meta": {
+                "commit": _commit(),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "cache_backend": settings.CACHES["default"]["BACKEND"],
+                "cache_key_prefix": CACHE_KEY_PREFIX,
+                "db_engine": settings.DATABASES["default"]["ENGINE"],
+                "upstream": "real" if upstream is None else "fake",
+                "upstream_latency": None if upstream is None else options["latency"],
+                "requests": options["requests"],
+                "concurrency": options["concurrency"],
+                "seed": options["seed"],
+            },
+            "results": results,
+        }
+        if options["output"]:
+            options["output"].write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+            self.stdout.write(f"Отчет сохранен в {options['output']}")
+
+        if baseline is not None:
+            regressions = compare(results, baseline["results"], options["threshold"])
+            for regression in regressions:
+                self.stderr.write(regression)
+            if regressions:
+                raise CommandError(f"Обнаружены регрессии: {len(regressions)}")
+            self.stdout.write(self.style.SUCCESS("Регрессий относительно базового отчета нет"))
@@ -0,0 +1,29 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from api.benchmarks import compare_fast_paths
+
+
+class Command(BaseCommand):
+    """
+    Сравнение быстрой проверки параметров и отрисовки JSON с путями DRF без запуска HTTP-запросов
+    """
+
+    help = "Замер времени проверки параметров запроса и отрисовки JSON: DRF и быстрые пути"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=10000, help="Количество вызовов в замере")
+        parser.add_argument("--json", action="store_true", help="Вывести результат в JSON")
+
+    def handle(self, *args, **options):
+        results = compare_fast_paths(options["number"])
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<12} DRF {result['drf_us']:>9} мкс  быстрый путь {result['fast_us']:>9} мкс  "
+                f"ускорение x{result['speedup']}"
+            )
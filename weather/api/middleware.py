@@ -0,0 +1,76 @@
+import cProfile
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+from external_api.timing import finish_request, server_timing, start_request
+from weather.config import get_config
+
+logger = logging.getLogger('django')
+
+# Одновременно профилируется только один запрос: профилировщики нескольких потоков мешают друг другу
+_profile_lock = threading.Lock()
+
+
+class ServerTimingMiddleware:
+    """
+    Замер этапов обработки запроса с выдачей в заголовке Server-Timing (SERVER_TIMING_ENABLED).
+    Доля PROFILE_SAMPLE_RATE запросов, а также запросы с заголовком X-Profile: <PROFILE_TOKEN>
+    профилируются cProfile, результат сохраняется в PROFILE_DIR
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = get_config()
+        self.enabled = config.server_timing_enabled
+        self.sample_rate = config.profile_sample_rate
+        self.profile_token = config.profile_token
+        self.profile_dir = Path(config.profile_dir or os.path.join(settings.BASE_DIR, "profiles"))
+
+    def _should_profile(self, request) -> bool:
+        if self.profile_token and request.headers.get("X-Profile") == self.profile_token:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        profiler = None
+        if self._should_profile(request) and _profile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+
+        token = start_request()
+        started = time.perf_counter()
+        try:
+            if profiler is not None:
+                profiler.enable()
+            response = self.get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                _profile_lock.release()
+            total = time.perf_counter() - started
+            timings = finish_request(token)
+
+        if self.enabled:
+            response["Server-Timing"] = server_timing(timings, total)
+        if profiler is not None:
+            self._save_profile(profiler, request, total)
+        return response
+
+    def _save_profile(self, profiler: cProfile.Profile, request, total: float) -> None:
+        path = re.sub(r"[^A-Za-z0-9]+", "_", request.path).strip("_") or "root"
+        name = (
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-{path}"
+            f"-{total * 1000:.0f}ms-{uuid.uuid4().hex[:6]}.prof"
+        )
+        try:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(self.profile_dir / name)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить профиль запроса: {e}")
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name='HandForecasts',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city', models.CharField(max_length=100)),
+                ('date', models.DateField()),
+                ('min_temperature', models.FloatField()),
+                ('max_temperature', models.FloatField()),
+            ],
+            options={
+                'unique_together': {('city', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+from external_api.cities import normalize_city
+
+
+def fill_city_key(apps, schema_editor):
+    """
+    Заполнение city_key по названию города (см. external_api.cities.city_key).
+    Если несколько написаний одного города дают одну пару (ключ, дата), остается последняя сохраненная запись
+    """
+    HandForecasts = apps.get_model('api', 'HandForecasts')
+    CityAlias = apps.get_model('external_api', 'CityAlias')
+    aliases = dict(CityAlias.objects.values_list('alias', 'city_id'))
+
+    seen, duplicates, batch = set(), [], []
+    for forecast in HandForecasts.objects.order_by('-id').iterator(chunk_size=1000):
+        alias = normalize_city(forecast.city)
+        key = f"id{aliases[alias]}" if alias in aliases else alias
+        if (key, forecast.date) in seen:
+            duplicates.append(forecast.pk)
+            continue
+        seen.add((key, forecast.date))
+        forecast.city_key = key
+        batch.append(forecast)
+        if len(batch) >= 1000:
+            HandForecasts.objects.bulk_update(batch, ['city_key'])
+            batch = []
+
+    if batch:
+        HandForecasts.objects.bulk_update(batch, ['city_key'])
+    HandForecasts.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_handforecasts_city_key'),
+        ('external_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_city_key, migrations.RunPython.noop),
+    ]
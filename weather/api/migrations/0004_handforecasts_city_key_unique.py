@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_fill_handforecasts_city_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='handforecasts',
+            name='city_key',
+            field=models.CharField(db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AlterUniqueTogether(
+            name='handforecasts',
+            unique_together={('city_key', 'date')},
+        ),
+    ]
@@ -1,14 +1,25 @@
 from django.db import models
 
+from external_api.cities import city_key
+
 
 class HandForecasts(models.Model):
     """
     Модель для хранения прогнозов, сохраненных вручную
     """
     city = models.CharField(max_length=100)
+    # Канонический ключ города (см. external_api.cities.city_key)
+    city_key = models.CharField(max_length=100, db_index=True, editable=False)
     date = models.DateField()
     min_temperature = models.FloatField()
     max_temperature = models.FloatField()
 
     class Meta:
-        unique_together = ('city', 'date')
+        unique_together = ('city_key', 'date')
+
+    def save(self, *args, **kwargs):
+        from api.index import hand_forecast_index
+
+        self.city_key = city_key(self.city)
+        super().save(*args, **kwargs)
+        hand_forecast_index.add([(self.city_key, self.date)])
@@ -0,0 +1,106 @@
+import time
+import uuid
+
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from api.conditional import not_modified, with_validators
+from external_api.cities import city_key, city_keys
+from external_api.metrics import CACHE_REQUESTS
+from external_api.timing import phase
+from weather.config import get_config
+
+PREFIX = "response"
+VERSION_PREFIX = "response_version"
+# Время жизни версии должно быть больше времени жизни любого закэшированного ответа
+VERSION_TIMEOUT = 60 * 60 * 24
+
+
+def response_timeout() -> int:
+    """
+    Время жизни ответа с прогнозами из бд (такие ответы сбрасываются при изменении прогнозов города)
+    """
+    return get_config().response_cache_timeout
+
+
+class ResponseCache:
+    """
+    Кэш готовых (отрисованных) ответов GET по нормализованным параметрам запроса.
+    Запись сбрасывается при изменении прогнозов города, сохраненных вручную (invalidate_cities).
+    Выключается через RESPONSE_CACHE_ENABLED=0
+
+    :param request: запрос DRF (после аутентификации и выбора формата ответа)
+    :param kind: вид ответа (current, forecast, forecast_range)
+    :param params: параметры запроса, кроме city, от которых зависит ответ
+    """
+
+    def __init__(self, request, kind: str, params: tuple[str, ...] = ()):
+        self.request = request
+        self.key = self.version_key = self.version = None
+
+        city = request.query_params.get("city", "").strip()
+        if city and get_config().response_cache_enabled:
+            key = city_key(city)
+            values = ":".join(request.query_params.get(name, "").strip() for name in params)
+            self.key = f"{PREFIX}:{kind}:{request.accepted_renderer.format}:{key}:{values}"
+            self.version_key = f"{VERSION_PREFIX}:{key}"
+
+    def get(self) -> HttpResponse | None:
+        """
+        Ответ из кэша или None.
+        Если If-None-Match совпадает с ETag закэшированного ответа, возвращается 304
+        """
+        if self.key is None:
+            return None
+
+        with phase("cache"):
+            values = cache.get_many([self.key, self.version_key])
+        # Версия запоминается до формирования ответа: изменение прогноза во время запроса сбросит запись
+        self.version = values.get(self.version_key)
+        entry = values.get(self.key)
+        if entry is None or entry["version"] != self.version:
+            CACHE_REQUESTS.inc(PREFIX, "miss")
+            return None
+        CACHE_REQUESTS.inc(PREFIX, "hit")
+
+        if not_modified(self.request, entry["etag"]):
+            response = HttpResponse(status=304)
+        else:
+            response = HttpResponse(entry["content"], content_type=entry["content_type"])
+        return with_validators(response, entry["etag"], entry["client_expires_at"] - time.time())
+
+    def store(self, response, timeout: float, max_age: float | None = None) -> None:
+        """
+        Сохранение ответа 200 в кэш после его отрисовки
+
+        :param timeout: время жизни записи, секунды (0 - не кэшировать)
+        :param max_age: время, в течение которого клиент может не перепроверять ответ (по умолчанию timeout)
+        """
+        timeout = min(int(timeout), VERSION_TIMEOUT)
+        if self.key is None or timeout <= 0 or response.status_code != 200:
+            return
+
+        now = time.time()
+        entry = {
+            "etag": response.get("ETag"),
+            "client_expires_at": now + (timeout if max_age is None else max_age),
+            "version": self.version,
+        }
+
+        def save(rendered):
+            entry["content"] = rendered.content
+            entry["content_type"] = rendered["Content-Type"]
+            cache.set(self.key, entry, timeout=timeout)
+
+        response.add_post_render_callback(save)
+
+
+def invalidate_cities(cities) -> None:
+    """
+    Сброс закэшированных ответов с прогнозами для городов (по всем ключам, под которыми город мог быть запрошен)
+    """
+    version = uuid.uuid4().hex
+    cache.set_many(
+        {f"{VERSION_PREFIX}:{key}": version for city in set(cities) for key in city_keys(city)},
+        timeout=VERSION_TIMEOUT
+    )
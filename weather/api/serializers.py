@@ -1,11 +1,105 @@
-import os
-from datetime import datetime
+import re
+from datetime import date, datetime, timedelta
 
 from django.utils import timezone
 from rest_framework import serializers
 
+from external_api.timing import phase
+from weather.config import get_config
 
-class CurrentWeatherSerializer(serializers.Serializer):
+_DATE_RE = re.compile(r"([0-9]{2})\.([0-9]{2})\.([0-9]{4})")
+# Символы, которые отклоняет CharField
+_PROHIBITED_RE = re.compile("[\x00\ud800-\udfff]")
+
+
+def validate_forecast_date(value):
+    """
+    Проверка, что дата прогноза не в прошлом и не дальше DELTA_DAYS дней в будущем
+    """
+    today = timezone.now().date()
+    if value < today:
+        raise serializers.ValidationError("Дата не может быть в прошлом")
+
+    delta_days = get_config().delta_days
+    if value > today + timedelta(days=delta_days):
+        raise serializers.ValidationError(f"Дата не может быть больше {delta_days} дней в будущем")
+
+    return value
+
+
+def _parse_date(value) -> date | None:
+    if not isinstance(value, str):
+        return None
+    match = _DATE_RE.fullmatch(value)
+    if match is None:
+        return None
+    try:
+        return date(int(match[3]), int(match[2]), int(match[1]))
+    except ValueError:
+        return None
+
+
+class QueryValidator:
+    """
+    Быстрая проверка параметров GET-запроса (city и даты в формате dd.mm.yyyy) без полей DRF.
+    Проверяются только корректные запросы: при любой ошибке проверка повторяется сериализатором,
+    поэтому ответы с ошибками не отличаются от ответов сериализатора
+
+    :param serializer_class: сериализатор с теми же правилами
+    :param dates: параметры с датами прогноза; две даты - начало и конец периода
+    """
+
+    def __init__(self, serializer_class, dates: tuple[str, ...] = ()):
+        self.serializer_class = serializer_class
+        self.dates = dates
+
+    def validate(self, query_params) -> tuple[dict | None, dict | None]:
+        """
+        :return: (validated_data, None) или (None, ошибки сериализатора)
+        """
+        with phase("validation"):
+            data = self._validate_fast(query_params)
+        if data is not None:
+            return data, None
+
+        serializer = self.serializer_class(data=query_params)
+        if serializer.is_valid():
+            return serializer.validated_data, None
+        return None, serializer.errors
+
+    def _validate_fast(self, query_params) -> dict | None:
+        city = query_params.get("city")
+        if not isinstance(city, str):
+            return None
+        city = city.strip()
+        if not city or _PROHIBITED_RE.search(city):
+            return None
+
+        data = {"city": city}
+        if self.dates:
+            today = timezone.now().date()
+            last_day = today + timedelta(days=get_config().delta_days)
+            for name in self.dates:
+                value = _parse_date(query_params.get(name))
+                if value is None or value < today or value > last_day:
+                    return None
+                data[name] = value
+            if len(self.dates) == 2 and data[self.dates[0]] > data[self.dates[1]]:
+                return None
+        return data
+
+
+class TimedSerializer(serializers.Serializer):
+    """
+    Сериализатор с замером длительности валидации (этап validation в Server-Timing)
+    """
+
+    def is_valid(self, *, raise_exception=False):
+        with phase("validation"):
+            return super().is_valid(raise_exception=raise_exception)
+
+
+class CurrentWeatherSerializer(TimedSerializer):
     city = serializers.CharField()
 
     def validate_city(self, value):
@@ -14,7 +108,15 @@ class CurrentWeatherSerializer(serializers.Serializer):
         return value
 
 
-class ForecastGetSerializer(serializers.Serializer):
+class CurrentWeatherBatchSerializer(TimedSerializer):
+    cities = serializers.ListField(
+        child=serializers.CharField(max_length=100),
+        allow_empty=False,
+        max_length=get_config().batch_max_cities
+    )
+
+
+class ForecastGetSerializer(TimedSerializer):
     city = serializers.CharField()
     date = serializers.DateField(
         input_formats=["%d.%m.%Y"]
@@ -35,14 +137,7 @@ class ForecastGetSerializer(serializers.Serializer):
         if not value:
             raise serializers.ValidationError("Обязательное поле: date")
 
-        if value < timezone.now().date():
-            raise serializers.ValidationError("Дата не может быть в прошлом")
-
-        delta_days = int(os.getenv("DELTA_DAYS", 10))
-        if value > timezone.now().date() + timezone.timedelta(days=delta_days):
-            raise serializers.ValidationError(f"Дата не может быть больше {delta_days} дней в будущем")
-
-        return value
+        return validate_forecast_date(value)
 
     def to_representation(self, instance):
         ret = super().to_representation(instance)
@@ -50,7 +145,35 @@ class ForecastGetSerializer(serializers.Serializer):
         return ret
 
 
-class HandForecastUpdateSerializer(serializers.Serializer):
+class ForecastRangeGetSerializer(TimedSerializer):
+    city = serializers.CharField()
+    date_from = serializers.DateField(input_formats=["%d.%m.%Y"])
+    date_to = serializers.DateField(input_formats=["%d.%m.%Y"])
+
+    def validate_date_from(self, value):
+        """
+        Валидация начала периода
+        """
+        return validate_forecast_date(value)
+
+    def validate_date_to(self, value):
+        """
+        Валидация конца периода
+        """
+        return validate_forecast_date(value)
+
+    def validate(self, data):
+        """
+        Валидация периода
+        """
+        if data["date_from"] > data["date_to"]:
+            raise serializers.ValidationError({
+                "date_from": "Начало периода не может быть позже его конца"
+            })
+        return data
+
+
+class HandForecastUpdateSerializer(TimedSerializer):
     city = serializers.CharField(required=True, max_length=100)
     date = serializers.CharField(required=True)
     min_temperature = serializers.FloatField(required=True)
@@ -63,19 +186,7 @@ class HandForecastUpdateSerializer(serializers.Serializer):
         except ValueError:
             raise serializers.ValidationError("Неверный формат даты. Используйте dd.MM.yyyy")
 
-        if value < timezone.now().date():
-            raise serializers.ValidationError("Дата не может быть в прошлом")
-
-        # Проверка будущего (макс +10 дней)
-        delta_days = int(os.getenv("DELTA_DAYS", 10))
-        max_date = timezone.now().date() + timezone.timedelta(days=delta_days)
-
-        if value > max_date:
-            raise serializers.ValidationError(
-                f"Дата не может быть больше {delta_days} дней в будущем"
-            )
-
-        return value
+        return validate_forecast_date(value)
 
     def validate(self, data):
         """Валидация взаимосвязи полей"""
@@ -1,8 +1,10 @@
 from django.urls import path
 
-from api.views import CurrentWeatherView, ForecastView
+from api.views import CurrentWeatherBatchView, CurrentWeatherView, ForecastImportView, ForecastView
 
 urlpatterns = [
     path('weather/current', CurrentWeatherView.as_view()),
+    path('weather/current/batch', CurrentWeatherBatchView.as_view()),
     path('weather/forecast', ForecastView.as_view()),
+    path('weather/forecast/import', ForecastImportView.as_view()),
 ]
@@ -1,13 +1,32 @@
+import codecs
+import csv
+import hmac
+import time
+
+from django.http import HttpResponse
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from api.handlers import HandForecastsHandler
-from api.models import HandForecasts
-from api.serializers import CurrentWeatherSerializer, ForecastGetSerializer, HandForecastUpdateSerializer
+from api.conditional import cache_validators, make_etag, not_modified, not_modified_response, with_validators
+from api.handlers import CurrentWeatherBatchHandler, CurrentWeatherHandler, HandForecastsHandler
+from api.response_cache import ResponseCache, response_timeout
+from api.serializers import (
+    CurrentWeatherBatchSerializer,
+    CurrentWeatherSerializer,
+    ForecastGetSerializer,
+    ForecastRangeGetSerializer,
+    HandForecastUpdateSerializer,
+    QueryValidator
+)
+from external_api import metrics
+from external_api.cities import city_key
 from external_api.openweathermap_client import OpenWeatherClient, OpenWeatherClientError
+from external_api.warmup import track_city
 from external_api.worldtime_client import CityTimeClient, CityTimeClientError
+from weather.config import get_config
 
 
 class CurrentWeatherView(APIView):
@@ -16,24 +35,48 @@ class CurrentWeatherView(APIView):
     """
 
     permission_classes = [IsAuthenticated]
+    query_validator = QueryValidator(CurrentWeatherSerializer)
+
+    @staticmethod
+    def validators(city: str) -> tuple[str | None, float]:
+        """
+        ETag и время жизни ответа: версия закэшированной температуры и текущая минута
+        (локальное время в ответе меняется раз в минуту)
+        """
+        now = time.time()
+        etag, max_age = cache_validators("current_weather", city, int(now // 60))
+        return etag, min(max_age, 60 - now % 60)
 
     def get(self, request):
+        response_cache = ResponseCache(request, "current")
+        cached = response_cache.get()
+        if cached is not None:
+            track_city(request.query_params["city"])
+            return cached
 
-        serializer = CurrentWeatherSerializer(data=request.query_params)
-        if not serializer.is_valid():
+        data, errors = self.query_validator.validate(request.query_params)
+        if errors is not None:
             return Response(
-                serializer.errors,
+                errors,
                 status=status.HTTP_400_BAD_REQUEST
             )
-        city = serializer.validated_data["city"]
+        city = data["city"]
+        track_city(city)
+        if "If-None-Match" in request.headers:
+            etag, max_age = self.validators(city)
+            if not_modified(request, etag):
+                return not_modified_response(etag, max_age)
+
         try:
-            temperature = OpenWeatherClient().get_current_weather(city)
-            local_time = CityTimeClient().get_time(city)
+            temperature, local_time = CurrentWeatherHandler.get_current_weather(city)
 
-            return Response({
+            etag, max_age = self.validators(city)
+            response = with_validators(Response({
                 "temperature": temperature,
                 "local_time": local_time
-            })
+            }), etag, max_age)
+            response_cache.store(response, max_age if etag else 0)
+            return response
 
         except OpenWeatherClientError as e:
             return Response(
@@ -52,29 +95,147 @@ class CurrentWeatherView(APIView):
             )
 
 
+class CurrentWeatherBatchView(APIView):
+    """
+    Представление для получения текущей погоды сразу для нескольких городов
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = CurrentWeatherBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cities = serializer.validated_data["cities"]
+        for city in cities:
+            track_city(city)
+
+        return Response(CurrentWeatherBatchHandler.get_current_weather(cities))
+
+
 class ForecastView(APIView):
     permission_classes = [IsAuthenticated]
+    query_validator = QueryValidator(ForecastGetSerializer, ("date",))
+    range_validator = QueryValidator(ForecastRangeGetSerializer, ("date_from", "date_to"))
 
     def get(self, request):
         """
         Метод для получения прогноза погоды на указанную дату
+        или за период (параметры date_from и date_to)
         """
-        serializer = ForecastGetSerializer(data=request.query_params)
-        if not serializer.is_valid():
+        if "date_from" in request.query_params or "date_to" in request.query_params:
+            return self.get_range(request)
+
+        # Даты проверяются до кэша ответов: ответ на сегодняшнюю дату не должен отдаваться после полуночи
+        data, errors = self.query_validator.validate(request.query_params)
+        if errors is not None:
             return Response(
-                serializer.errors,
+                errors,
                 status=status.HTTP_400_BAD_REQUEST
             )
-        city = serializer.validated_data["city"]
-        date = serializer.validated_data["date"]
+        city = data["city"]
+        date = data["date"]
+        track_city(city)
+
+        response_cache = ResponseCache(request, "forecast", ("date",))
+        cached = response_cache.get()
+        if cached is not None:
+            return cached
 
         try:
             forecast_from_db = HandForecastsHandler.get_forecast(city, date)
             if forecast_from_db:
-                return Response(forecast_from_db)
+                # Прогноз из бд может измениться в любой момент, поэтому клиент должен его перепроверять
+                etag = make_etag("hand_forecast", city_key(city), date, forecast_from_db)
+                if not_modified(request, etag):
+                    return not_modified_response(etag, 0)
+                response = with_validators(Response(forecast_from_db), etag, 0)
+                response_cache.store(response, response_timeout(), max_age=0)
+                return response
+
+            if "If-None-Match" in request.headers:
+                etag, max_age = cache_validators("daily_forecast", city, date)
+                if not_modified(request, etag):
+                    return not_modified_response(etag, max_age)
 
             forecast = OpenWeatherClient().get_forecast_by_date(city, date)
-            return Response(forecast)
+            etag, max_age = cache_validators("daily_forecast", city, date)
+            response = with_validators(Response(forecast), etag, max_age)
+            response_cache.store(response, max_age if etag else 0)
+            return response
+
+        except OpenWeatherClientError as e:
+            return Response(
+                {"error": f"Ошибка работы с API OpenWeather - {e}"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        except Exception as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @staticmethod
+    def range_validators(city: str, date_from, date_to, forecasts_from_db: dict,
+                         needs_api: bool) -> tuple[str | None, float]:
+        """
+        ETag и время жизни данных ответа за период
+        """
+        from_db = sorted(forecasts_from_db.items())
+        if not needs_api:
+            return make_etag("hand_forecast", city_key(city), date_from, date_to, from_db), response_timeout()
+
+        etag, ttl = cache_validators("daily_forecast", city, date_from, date_to, from_db)
+        return etag, min(ttl, response_timeout()) if from_db else ttl
+
+    def get_range(self, request):
+        """
+        Метод для получения прогноза погоды за период.
+        Прогнозы из бд перекрывают данные API по дням
+        """
+        data, errors = self.range_validator.validate(request.query_params)
+        if errors is not None:
+            return Response(
+                errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        city = data["city"]
+        date_from = data["date_from"]
+        date_to = data["date_to"]
+        track_city(city)
+
+        response_cache = ResponseCache(request, "forecast_range", ("date_from", "date_to"))
+        cached = response_cache.get()
+        if cached is not None:
+            return cached
+
+        try:
+            forecasts_from_db = HandForecastsHandler.get_forecasts(city, date_from, date_to)
+            needs_api = len(forecasts_from_db) < (date_to - date_from).days + 1
+            # Прогнозы из бд могут измениться в любой момент, поэтому ответ с ними клиент должен перепроверять
+            revalidate = bool(forecasts_from_db)
+
+            etag, ttl = None, 0
+            if not needs_api or "If-None-Match" in request.headers:
+                etag, ttl = self.range_validators(city, date_from, date_to, forecasts_from_db, needs_api)
+                if not_modified(request, etag):
+                    return not_modified_response(etag, 0 if revalidate else ttl)
+
+            forecasts = {}
+            if needs_api:
+                forecasts = OpenWeatherClient().get_forecast_by_dates(city, date_from, date_to)
+                etag, ttl = self.range_validators(city, date_from, date_to, forecasts_from_db, needs_api)
+            forecasts.update(forecasts_from_db)
+
+            response = with_validators(Response([
+                {"date": day.strftime("%Y-%m-%d"), **forecasts[day]}
+                for day in sorted(forecasts)
+            ]), etag, 0 if revalidate else ttl)
+            response_cache.store(response, ttl if etag else 0, 0 if revalidate else ttl)
+            return response
 
         except OpenWeatherClientError as e:
             return Response(
@@ -98,13 +259,11 @@ class ForecastView(APIView):
             )
         try:
             validated_data = serializer.validated_data
-            forecast, created = HandForecasts.objects.update_or_create(
+            created = HandForecastsHandler.save_forecast(
                 city=validated_data['city'],
                 date=validated_data['date'],
-                defaults={
-                    'min_temperature': validated_data['min_temperature'],
-                    'max_temperature': validated_data['max_temperature']
-                }
+                min_temperature=validated_data['min_temperature'],
+                max_temperature=validated_data['max_temperature']
             )
 
             return Response(
@@ -115,3 +274,52 @@ class ForecastView(APIView):
                 {"error": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class ForecastImportView(APIView):
+    """
+    Представление для массовой загрузки прогнозов погоды из JSON или CSV
+    """
+
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser]
+
+    def post(self, request):
+        """
+        Метод для загрузки прогнозов: JSON-список объектов или CSV (Content-Type: text/csv)
+        с колонками city, date, min_temperature, max_temperature. CSV читается построчно из тела запроса
+        """
+        if request.content_type.startswith("text/csv"):
+            rows = csv.DictReader(codecs.iterdecode(request.stream or [], "utf-8-sig"))
+        else:
+            rows = request.data
+            if not isinstance(rows, list):
+                return Response(
+                    {"error": "Ожидается список прогнозов"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        try:
+            return Response(HandForecastsHandler.import_forecasts(rows))
+        except Exception as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class MetricsView(APIView):
+    """
+    Метрики процесса в текстовом формате Prometheus.
+    Если задан METRICS_TOKEN, требуется заголовок Authorization: Bearer <METRICS_TOKEN>
+    """
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        token = get_config().metrics_token
+        if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+
+        return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ExternalApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'external_api'
+
+    def ready(self):
+        from external_api import cities, geocoding
+
+        cities.alias_learned.connect(geocoding.alias_learned, dispatch_uid="external_api_alias_learned")
@@ -0,0 +1,159 @@
+import re
+import unicodedata
+
+from django.core.cache import cache
+from django.dispatch import Signal
+
+from external_api.local_cache import LocalCache
+from external_api.metrics import CACHE_REQUESTS
+from external_api.models import CityAlias
+from weather.config import get_config
+
+CACHE_PREFIX = "city_alias"
+NOT_FOUND_PREFIX = "city_not_found"
+
+_spaces = re.compile(r"\s+")
+# Написания городов не меняются, поэтому известные id хранятся в процессе долго, а неизвестные - недолго
+_aliases = LocalCache(max_entries=10000, max_bytes=1024 * 1024, timeout=60 * 60)
+_UNKNOWN_TIMEOUT = 60
+
+# Написание стало алиасом известного города: записи, сохраненные по названию (ключ alias),
+# нужно перенести на канонический ключ (аргументы alias, city_key)
+alias_learned = Signal()
+
+
+def _alias_timeout() -> int:
+    return get_config().city_alias_cache_timeout
+
+
+class CityNotFoundError(Exception):
+    """
+    Примесь к ошибкам клиентов внешних API: город не найден.
+    Такой результат кэшируется (mark_city_not_found) отдельно для каждого внешнего API:
+    город, которого нет в геокодере, может быть известен OpenWeather, и наоборот
+    """
+    pass
+
+
+def _not_found_timeout() -> int:
+    return get_config().city_not_found_cache_timeout
+
+
+def normalize_city(city: str) -> str:
+    """
+    Приведение названия города к единому виду:
+    нормализация Unicode (NFKC), схлопывание пробелов, регистр
+
+    :param city: название города (например, ' Moscow ', 'МОСКВА')
+    :return: str
+    """
+    return _spaces.sub(" ", unicodedata.normalize("NFKC", city)).strip().casefold()
+
+
+def get_city_id(city: str) -> int | None:
+    """
+    Получение идентификатора города OpenWeather по любому известному написанию.
+    Порядок поиска: память процесса -> кэш -> бд
+
+    :param city: название города
+    :return: int or None, если написание еще не встречалось
+    """
+    alias = normalize_city(city)
+    city_id = _aliases.get(alias)
+    if city_id is None:
+        key = f"{CACHE_PREFIX}:{alias}"
+        city_id = cache.get(key)
+        if city_id is None:
+            city_id = CityAlias.objects.filter(alias=alias).values_list("city_id", flat=True).first() or 0
+            cache.set(key, city_id, timeout=_alias_timeout() if city_id else _UNKNOWN_TIMEOUT)
+        _aliases.set(alias, city_id, timeout=None if city_id else _UNKNOWN_TIMEOUT)
+
+    return city_id or None
+
+
+def remember_city(city_id: int, *names: str) -> None:
+    """
+    Сохранение написаний города в индекс алиасов.
+    Записи, сохраненные по новому написанию до того, как стал известен город, переносятся на его ключ (alias_learned)
+
+    :param city_id: идентификатор города в OpenWeather
+    :param names: написания названия города (запрос пользователя, название из ответа API)
+    """
+    for name in names:
+        if not name or get_city_id(name) == city_id:
+            continue
+
+        alias = normalize_city(name)
+        CityAlias.objects.update_or_create(alias=alias, defaults={"city_id": city_id})
+        cache.set(f"{CACHE_PREFIX}:{alias}", city_id, timeout=_alias_timeout())
+        _aliases.set(alias, city_id)
+        alias_learned.send(sender=CityAlias, alias=alias, city_key=f"id{city_id}")
+
+
+def city_key(city: str) -> str:
+    """
+    Канонический ключ города для кэша и бд:
+    "id<city_id>" для известных городов, иначе нормализованное название
+
+    :param city: название города
+    :return: str
+    """
+    city_id = get_city_id(city)
+    return f"id{city_id}" if city_id else normalize_city(city)
+
+
+def city_keys(city: str) -> list[str]:
+    """
+    Ключи, под которыми город мог быть сохранен: канонический и по названию
+    (записи, созданные до того, как стал известен идентификатор города)
+
+    :param city: название города
+    :return: list[str], канонический ключ первым
+    """
+    keys = [city_key(city), normalize_city(city)]
+    return keys[:1] if keys[0] == keys[1] else keys
+
+
+def city_query(city: str) -> dict:
+    """
+    Параметры запроса к OpenWeather: по id, если город известен, иначе по названию
+    """
+    city_id = get_city_id(city)
+    return {"id": city_id} if city_id else {"q": city}
+
+
+def _not_found_key(city: str, upstream: str) -> str:
+    return f"{NOT_FOUND_PREFIX}:{upstream}:{normalize_city(city)}"
+
+
+def mark_city_not_found(city: str, upstream: str) -> None:
+    """
+    Сохранение в кэш результата "город не найден" на CITY_NOT_FOUND_CACHE_TIMEOUT секунд
+
+    :param city: название города
+    :param upstream: внешний API, который не нашел город (openweather или geocoding)
+    """
+    cache.set(_not_found_key(city, upstream), True, timeout=_not_found_timeout())
+
+
+def is_city_not_found(city: str, upstream: str) -> bool:
+    """
+    Проверка, что город недавно не нашелся во внешнем API upstream
+    """
+    found = cache.get(_not_found_key(city, upstream)) is not None
+    CACHE_REQUESTS.inc(NOT_FOUND_PREFIX, "hit" if found else "miss")
+    return found
+
+
+def cities_not_found(cities: list[str], upstream: str) -> set[str]:
+    """
+    Города из списка, которые недавно не нашлись во внешнем API upstream (один запрос к кэшу)
+    """
+    if not cities:
+        return set()
+    cache_keys = {city: _not_found_key(city, upstream) for city in cities}
+    found = cache.get_many(list(set(cache_keys.values())))
+    not_found = {city for city, key in cache_keys.items() if key in found}
+    for city in cities:
+        CACHE_REQUESTS.inc(NOT_FOUND_PREFIX, "hit" if city in not_found else "miss")
+    return not_found
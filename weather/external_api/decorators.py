@@ -1,28 +1,335 @@
-import os
+import hashlib
+import logging
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 
 from django.core.cache import cache
+from django.db import close_old_connections
+from redis.exceptions import LockError
 
+from external_api.cities import city_key
+from external_api.local_cache import get_local_cache, publish_invalidation
+from external_api.metrics import CACHE_REQUESTS
+from external_api.timing import phase
+from weather.config import get_config
 
-def cached_data(prefix: str, timeout: int = None):
+logger = logging.getLogger('cache_logger')
+
+
+class _Call:
+    """
+    Выполняющийся запрос к внешнему API по ключу кэша
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls: dict[str, _Call] = {}
+_calls_lock = threading.Lock()
+_refreshing: set[str] = set()
+_executor = None
+
+
+def _lock_timeout() -> int:
+    return get_config().cache_lock_timeout
+
+
+def _lock_wait() -> float:
+    return get_config().cache_lock_wait
+
+
+def _local_get(local_cache, cache_key: str) -> dict | None:
+    """
+    Запись из локального кэша процесса, если она еще не удалена из Redis по времени жизни (expires_at)
+    """
+    entry = local_cache.get(cache_key)
+    if entry is not None and entry.get("expires_at", float("inf")) <= time.time():
+        local_cache.delete(cache_key)
+        return None
+    return entry
+
+
+def _local_set(local_cache, cache_key: str, entry: dict) -> None:
+    """
+    Сохранение записи в локальный кэш процесса не дольше, чем она живет в Redis
+    """
+    remaining = entry.get("expires_at", float("inf")) - time.time()
+    if remaining > 0:
+        local_cache.set(cache_key, entry, timeout=min(local_cache.timeout, remaining))
+
+
+def _read(cache_key: str) -> dict | None:
+    """
+    Чтение записи кэша вида {"value": ..., "fresh_until": timestamp, "expires_at": timestamp}.
+    Сначала проверяется локальный кэш процесса, затем Redis
+    """
+    local_cache = get_local_cache()
+    if local_cache is not None:
+        entry = _local_get(local_cache, cache_key)
+        if entry is not None:
+            return entry
+
+    entry = cache.get(cache_key)
+    if isinstance(entry, dict) and "fresh_until" in entry:
+        if local_cache is not None:
+            _local_set(local_cache, cache_key, entry)
+        return entry
+    return None
+
+
+def _read_many(cache_keys: list[str]) -> dict[str, dict]:
+    """
+    Чтение нескольких записей кэша: из локального кэша процесса и одним запросом к Redis
+    """
+    entries = {}
+    local_cache = get_local_cache()
+    if local_cache is not None:
+        for cache_key in cache_keys:
+            entry = _local_get(local_cache, cache_key)
+            if entry is not None:
+                entries[cache_key] = entry
+
+    missing = [cache_key for cache_key in cache_keys if cache_key not in entries]
+    if missing:
+        for cache_key, entry in cache.get_many(missing).items():
+            if isinstance(entry, dict) and "fresh_until" in entry:
+                entries[cache_key] = entry
+                if local_cache is not None:
+                    _local_set(local_cache, cache_key, entry)
+
+    return entries
+
+
+def _write(cache_key: str, entry: dict, timeout: int) -> None:
+    cache.set(cache_key, entry, timeout=timeout)
+    local_cache = get_local_cache()
+    if local_cache is not None:
+        _local_set(local_cache, cache_key, entry)
+        publish_invalidation(cache_key)
+
+
+def _version(value) -> str:
+    """
+    Версия данных: хэш значения. Обновление записи теми же данными версию не меняет
+    """
+    return hashlib.blake2b(pickle.dumps(value), digest_size=8).hexdigest()
+
+
+def _is_fresh(entry: dict) -> bool:
+    return entry["fresh_until"] > time.time()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _calls_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_config().cache_refresh_workers,
+                thread_name_prefix="cache-refresh"
+            )
+    return _executor
+
+
+def _refresh_in_background(cache_key: str, load) -> None:
+    """
+    Фоновое обновление устаревшей записи кэша.
+    Для одного ключа одновременно выполняется не больше одного обновления
+    """
+    with _calls_lock:
+        if cache_key in _calls or cache_key in _refreshing:
+            return
+        _refreshing.add(cache_key)
+
+    def task():
+        try:
+            _single_flight(cache_key, load)
+        except Exception as e:
+            logger.warning(f"Не удалось обновить {cache_key}: {e}")
+        finally:
+            with _calls_lock:
+                _refreshing.discard(cache_key)
+            close_old_connections()
+
+    _get_executor().submit(task)
+
+
+def _fetch_locked(cache_key: str, load, force: bool = False):
+    """
+    Загрузка данных под распределенной блокировкой Redis:
+    между процессами во внешний API идет только один запрос на ключ.
+    Если блокировку не удалось получить за CACHE_LOCK_WAIT секунд, данные загружаются без нее.
+    force - загрузить данные, даже если другой процесс уже обновил запись
+    """
+    if not hasattr(cache, "lock"):
+        return load()
+
+    lock = cache.lock(f"lock:{cache_key}", timeout=_lock_timeout())
+    acquired = lock.acquire(blocking_timeout=_lock_wait())
+    try:
+        if acquired and not force:
+            entry = _read(cache_key)
+            if entry is not None and _is_fresh(entry):
+                return entry["value"]
+        elif not acquired:
+            logger.warning(f"Не дождались блокировки {cache_key}, запрос без блокировки")
+
+        return load()
+    finally:
+        if acquired:
+            try:
+                lock.release()
+            except LockError:
+                pass
+
+
+def _single_flight(cache_key: str, load, force: bool = False):
+    """
+    Загрузка данных с объединением одновременных запросов по одному ключу.
+    Первый поток выполняет запрос, остальные ждут его результат не дольше CACHE_LOCK_WAIT секунд
+    """
+    with _calls_lock:
+        call = _calls.get(cache_key)
+        leader = call is None
+        if leader:
+            call = _calls[cache_key] = _Call()
+
+    if not leader:
+        if call.event.wait(_lock_wait()):
+            if call.error is not None:
+                raise call.error
+            return call.result
+        logger.warning(f"Не дождались загрузки {cache_key}, запрос без ожидания")
+        return load()
+
+    try:
+        call.result = _fetch_locked(cache_key, load, force)
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            _calls.pop(cache_key, None)
+        call.event.set()
+
+
+def cache_info(prefix: str, city: str) -> dict | None:
+    """
+    Версия закэшированных данных города (хэш значения) и сколько секунд запись еще будет свежей
+
+    :param prefix: префикс ключа кэша (как в cached_data)
+    :param city: название города
+    :return: dict: {"version": "5f1c0e2a9b7d4c13", "fresh_for": 120.5} or None, если записи нет
+    """
+    entry = _read(f"{prefix}:{city_key(city)}")
+    if entry is None:
+        return None
+    return {
+        # Записи, сохраненные до появления version, версионируются по значению при чтении
+        "version": entry.get("version") or _version(entry["value"]),
+        "fresh_for": entry["fresh_until"] - time.time(),
+    }
+
+
+def cached_data(prefix: str, timeout: int = None, stale_timeout: int = None):
     """
     Декоратор для кэширования данных погоды.
-    Формирует ключ как: "<prefix>:<city.lower()>"
+    Формирует ключ как: "<prefix>:<city_key(city)>", где city_key - канонический ключ города
+    При промахе во внешний API идет только один запрос на ключ (в потоках и процессах),
+    остальные запросы ждут его результат.
+    Запись считается свежей timeout секунд, затем еще stale_timeout секунд
+    отдается устаревшее значение, а обновление выполняется в фоне.
+    Перед Redis может стоять локальный LRU-кэш процесса (CACHE_L1_ENABLED).
+    Методы декорированной функции:
+    get_cached_many(self, cities) - закэшированные значения для нескольких городов одним запросом к кэшу;
+    fresh_for(city) - сколько секунд запись еще будет свежей (None, если записи нет);
+    refresh(self, city) - принудительная загрузка из API с записью в кэш
     """
-    timeout = timeout or int(os.getenv("CACHE_TIMEOUT", 600))
+    timeout = timeout or get_config().cache_timeout
+    if stale_timeout is None:
+        stale_timeout = get_config().cache_stale_timeout
 
     def decorator(func):
+        def make_load(self, city: str, cache_key: str, *args, **kwargs):
+            def load():
+                result = func(self, city, *args, **kwargs)
+                fetched_at = time.time()
+                entry = {
+                    "value": result,
+                    "fresh_until": fetched_at + timeout,
+                    # Время удаления из Redis: локальный кэш процесса не хранит запись дольше
+                    "expires_at": fetched_at + timeout + stale_timeout,
+                    "fetched_at": fetched_at,
+                    "version": _version(result),
+                }
+                _write(cache_key, entry, timeout + stale_timeout)
+                # Ответ API мог сообщить id города: следующие запросы пойдут уже по ключу с id
+                canonical_key = f"{prefix}:{city_key(city)}"
+                if canonical_key != cache_key:
+                    _write(canonical_key, entry, timeout + stale_timeout)
+                return result
+
+            return load
+
         @wraps(func)
         def wrapper(self, city: str, *args, **kwargs):
-            cache_key = f"{prefix}:{city.lower()}"
-            cached = cache.get(cache_key)
-            if cached is not None:
-                return cached
+            cache_key = f"{prefix}:{city_key(city)}"
+            load = make_load(self, city, cache_key, *args, **kwargs)
+
+            with phase("cache"):
+                entry = _read(cache_key)
+            if entry is not None:
+                if _is_fresh(entry):
+                    CACHE_REQUESTS.inc(prefix, "hit")
+                else:
+                    CACHE_REQUESTS.inc(prefix, "stale")
+                    _refresh_in_background(cache_key, load)
+                return entry["value"]
 
-            result = func(self, city, *args, **kwargs)
-            cache.set(cache_key, result, timeout=timeout)
+            CACHE_REQUESTS.inc(prefix, "miss")
+            return _single_flight(cache_key, load)
+
+        def get_cached_many(self, cities: list[str]) -> dict:
+            """
+            Значения из кэша для списка городов: {city: value}. Города без записи в кэше пропускаются
+            """
+            cache_keys = {city: f"{prefix}:{city_key(city)}" for city in cities}
+            with phase("cache"):
+                entries = _read_many(list(set(cache_keys.values())))
+
+            result = {}
+            for city, cache_key in cache_keys.items():
+                entry = entries.get(cache_key)
+                # Промахи учитываются при последующей загрузке города
+                if entry is None:
+                    continue
+                if _is_fresh(entry):
+                    CACHE_REQUESTS.inc(prefix, "hit")
+                else:
+                    CACHE_REQUESTS.inc(prefix, "stale")
+                    _refresh_in_background(cache_key, make_load(self, city, cache_key))
+                result[city] = entry["value"]
             return result
 
+        def fresh_for(city: str) -> float | None:
+            entry = _read(f"{prefix}:{city_key(city)}")
+            if entry is None:
+                return None
+            return entry["fresh_until"] - time.time()
+
+        def refresh(self, city: str, *args, **kwargs):
+            cache_key = f"{prefix}:{city_key(city)}"
+            return _single_flight(cache_key, make_load(self, city, cache_key, *args, **kwargs), force=True)
+
+        wrapper.get_cached_many = get_cached_many
+        wrapper.fresh_for = fresh_for
+        wrapper.refresh = refresh
         return wrapper
 
     return decorator
@@ -0,0 +1,247 @@
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from zoneinfo import ZoneInfo
+
+# id, название, широта, долгота, часовой пояс, средняя температура
+CITIES = [
+    (524901, "Moscow", 55.7522, 37.6156, "Europe/Moscow", 8.0),
+    (2643743, "London", 51.5085, -0.1257, "Europe/London", 11.0),
+    (2950159, "Berlin", 52.5244, 13.4105, "Europe/Berlin", 10.0),
+    (2988507, "Paris", 48.8534, 2.3488, "Europe/Paris", 12.5),
+    (2759794, "Amsterdam", 52.3740, 4.8897, "Europe/Amsterdam", 10.5),
+    (3169070, "Rome", 41.8919, 12.5113, "Europe/Rome", 16.0),
+    (5128581, "New York", 40.7143, -74.0060, "America/New_York", 13.0),
+    (1850147, "Tokyo", 35.6895, 139.6917, "Asia/Tokyo", 15.5),
+    (2147714, "Sydney", -33.8679, 151.2073, "Australia/Sydney", 18.0),
+    (3143244, "Oslo", 59.9127, 10.7461, "Europe/Oslo", 6.0),
+]
+_by_name = {city[1].lower(): city for city in CITIES}
+_by_id = {city[0]: city for city in CITIES}
+
+# Названия, для которых сервер отвечает "город не найден"
+UNKNOWN_PREFIXES = ("nowhere", "unknown")
+
+
+def _find_city(name: str | None = None, city_id: str | None = None) -> tuple | None:
+    """
+    Поиск города в справочнике. Неизвестные названия получают детерминированные
+    id и координаты, названия с префиксами UNKNOWN_PREFIXES не находятся
+    """
+    if city_id:
+        return _by_id.get(int(city_id)) or _generated_by_id.get(int(city_id))
+
+    key = (name or "").strip().lower()
+    if not key or key.startswith(UNKNOWN_PREFIXES):
+        return None
+    if key in _by_name:
+        return _by_name[key]
+
+    seed = zlib.crc32(key.encode())
+    city = (
+        1_000_000 + seed % 9_000_000,
+        name.strip().title(),
+        (seed % 12000) / 100 - 60,
+        (seed // 12000 % 36000) / 100 - 180,
+        "UTC",
+        (seed % 300) / 10 - 5,
+    )
+    _generated_by_id[city[0]] = city
+    return city
+
+
+_generated_by_id: dict[int, tuple] = {}
+
+
+def _temperature(base: float, moment: datetime) -> float:
+    return round(base + 6 * math.sin((moment.hour - 9) / 24 * 2 * math.pi), 2)
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    """
+    Обработчик запросов, имитирующий OpenWeather (/data/2.5/weather, /data/2.5/forecast),
+    WorldTime (/v1/worldtime) и Nominatim (/search)
+    """
+
+    server: "FakeUpstreamServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, payload) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        failure = self.server.simulate()
+        if failure is not None:
+            return self._send(*failure)
+
+        routes = {
+            "/data/2.5/weather": self._weather,
+            "/data/2.5/forecast": self._forecast,
+            "/v1/worldtime": self._worldtime,
+            "/search": self._search,
+        }
+        route = routes.get(url.path)
+        if route is None:
+            return self._send(404, {"message": "not found"})
+        return route(params)
+
+    def _weather(self, params: dict):
+        city = _find_city(params.get("q"), params.get("id"))
+        if city is None:
+            return self._send(404, {"cod": "404", "message": "city not found"})
+
+        now = datetime.now(timezone.utc)
+        return self._send(200, {
+            "id": city[0],
+            "name": city[1],
+            "coord": {"lat": city[2], "lon": city[3]},
+            "main": {"temp": _temperature(city[5], now)},
+            "dt": int(now.timestamp()),
+            "cod": 200,
+        })
+
+    def _forecast(self, params: dict):
+        city = _find_city(params.get("q"), params.get("id"))
+        if city is None:
+            return self._send(404, {"cod": "404", "message": "city not found"})
+
+        start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        start += timedelta(hours=3 - start.hour % 3)
+        slots = []
+        for step in range(40):
+            moment = start + timedelta(hours=3 * step)
+            temp = _temperature(city[5], moment)
+            slots.append({
+                "dt": int(moment.timestamp()),
+                "dt_txt": moment.strftime("%Y-%m-%d %H:%M:%S"),
+                "main": {"temp": temp, "temp_min": round(temp - 0.8, 2), "temp_max": round(temp + 0.8, 2)},
+            })
+
+        return self._send(200, {
+            "cod": "200",
+            "list": slots,
+            "city": {"id": city[0], "name": city[1], "coord": {"lat": city[2], "lon": city[3]}},
+        })
+
+    def _worldtime(self, params: dict):
+        try:
+            lat, lon = float(params["lat"]), float(params["lon"])
+        except (KeyError, ValueError):
+            return self._send(400, {"message": "lat and lon are required"})
+
+        city = min(CITIES, key=lambda item: (item[2] - lat) ** 2 + (item[3] - lon) ** 2)
+        zone = city[4] if abs(city[2] - lat) < 1 and abs(city[3] - lon) < 1 else "UTC"
+        now = datetime.now(ZoneInfo(zone))
+        return self._send(200, {
+            "timezone": zone,
+            "datetime": now.strftime("%Y-%m-%d %H:%M:%S"),
+            "date": now.strftime("%Y-%m-%d"),
+            "hour": now.strftime("%H"),
+            "minute": now.strftime("%M"),
+        })
+
+    def _search(self, params: dict):
+        city = _find_city(params.get("q"))
+        if city is None:
+            return self._send(200, [])
+
+        return self._send(200, [{
+            "place_id": city[0],
+            "lat": str(city[2]),
+            "lon": str(city[3]),
+            "display_name": city[1],
+            "boundingbox": [str(city[2] - 0.1), str(city[2] + 0.1), str(city[3] - 0.1), str(city[3] + 0.1)],
+        }])
+
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    """
+    Локальная замена внешних API для профилирования и нагрузочного тестирования.
+
+    :param latency: задержка ответа, секунды
+    :param jitter: случайная добавка к задержке, секунды
+    :param error_rate: доля ответов 503
+    :param rate_limit: максимум запросов в секунду, сверх лимита - 429 (0 - без ограничения)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], latency: float = 0, jitter: float = 0,
+                 error_rate: float = 0, rate_limit: float = 0, verbose: bool = False):
+        super().__init__(address, FakeUpstreamHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.verbose = verbose
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def simulate(self) -> tuple[int, dict] | None:
+        """
+        Задержка, ограничение частоты и случайные ошибки.
+        Возвращает (статус, тело) ответа-ошибки или None
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 1:
+                self._window_start = now
+                self._window_count = 0
+            self._window_count += 1
+            limited = self.rate_limit and self._window_count > self.rate_limit
+            failed = self._random.random() < self.error_rate
+            delay = self.latency + self._random.uniform(0, self.jitter)
+
+        if delay:
+            time.sleep(delay)
+        if limited:
+            return 429, {"cod": 429, "message": "rate limit exceeded"}
+        if failed:
+            return 503, {"cod": 503, "message": "service unavailable"}
+        return None
+
+    def start(self) -> threading.Thread:
+        """
+        Запуск сервера в фоновом потоке
+        """
+        thread = threading.Thread(target=self.serve_forever, name="fake-upstream", daemon=True)
+        thread.start()
+        return thread
+
+    def env(self) -> dict[str, str]:
+        """
+        Переменные окружения, направляющие клиентов на этот сервер
+        """
+        return {
+            "OPENWEATHER_BASE_URL": f"{self.url}/data/2.5",
+            "OPENWEATHER_API_KEY": "fake",
+            "WORLD_TIME_API_URL": f"{self.url}/v1/worldtime",
+            "WORLD_TIME_API_KEY": "fake",
+            "NOMINATIM_DOMAIN": self.url.split("://", 1)[1],
+            "NOMINATIM_SCHEME": "http",
+        }
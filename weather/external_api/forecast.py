@@ -0,0 +1,109 @@
+from array import array
+from datetime import date
+
+# Температуры хранятся в сотых долях градуса в массивах int16
+_SCALE = 100
+_MISSING = -32768
+
+
+class DailyForecast:
+    """
+    Дневные агрегаты прогноза (минимум, максимум и среднее за день).
+    Значения лежат в массивах, индекс - смещение дня от первого дня прогноза
+    """
+
+    __slots__ = ("start", "minimums", "maximums", "means")
+
+    def __init__(self, start: int, minimums: array, maximums: array, means: array):
+        self.start = start
+        self.minimums = minimums
+        self.maximums = maximums
+        self.means = means
+
+    @classmethod
+    def from_slots(cls, slots: list[dict]) -> "DailyForecast":
+        """
+        Сборка агрегатов за один проход по 3-часовым интервалам из ответа OpenWeather /forecast
+
+        :param slots: список "list" из ответа API
+        :return: DailyForecast
+        """
+        start = None
+        minimums, maximums, sums, counts = [], [], [], []
+        for slot in slots:
+            day = date.fromisoformat(slot["dt_txt"][:10]).toordinal()
+            if start is None:
+                start = day
+
+            index = day - start
+            if index < 0:
+                continue
+            while len(counts) <= index:
+                minimums.append(float("inf"))
+                maximums.append(float("-inf"))
+                sums.append(0.0)
+                counts.append(0)
+
+            main = slot["main"]
+            minimums[index] = min(minimums[index], main["temp_min"])
+            maximums[index] = max(maximums[index], main["temp_max"])
+            sums[index] += main["temp"]
+            counts[index] += 1
+
+        def pack(values):
+            return array("h", (
+                round(value * _SCALE) if count else _MISSING
+                for value, count in zip(values, counts)
+            ))
+
+        return cls(
+            start=start or 0,
+            minimums=pack(minimums),
+            maximums=pack(maximums),
+            means=pack(total / count if count else 0 for total, count in zip(sums, counts)),
+        )
+
+    def __len__(self) -> int:
+        return len(self.minimums)
+
+    def _index(self, day: date) -> int | None:
+        index = day.toordinal() - self.start
+        if 0 <= index < len(self.minimums) and self.minimums[index] != _MISSING:
+            return index
+        return None
+
+    def get(self, day: date) -> dict | None:
+        """
+        Прогноз на день
+
+        :param day: дата
+        :return: dict: {"min_temperature": 11.1, "max_temperature": 24.5} or None, если дня нет в прогнозе
+        """
+        index = self._index(day)
+        if index is None:
+            return None
+        return {
+            "min_temperature": self.minimums[index] / _SCALE,
+            "max_temperature": self.maximums[index] / _SCALE,
+        }
+
+    def get_mean(self, day: date) -> float | None:
+        """
+        Средняя температура за день
+        """
+        index = self._index(day)
+        if index is None:
+            return None
+        return self.means[index] / _SCALE
+
+    def __reduce__(self):
+        return _restore, (self.start, self.minimums.tobytes(), self.maximums.tobytes(), self.means.tobytes())
+
+
+def _restore(start: int, minimums: bytes, maximums: bytes, means: bytes) -> DailyForecast:
+    def unpack(data):
+        values = array("h")
+        values.frombytes(data)
+        return values
+
+    return DailyForecast(start, unpack(minimums), unpack(maximums), unpack(means))
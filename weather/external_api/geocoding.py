@@ -0,0 +1,220 @@
+import logging
+import threading
+from functools import partial
+
+from django.core.cache import cache
+
+from external_api.cities import city_key, city_keys
+from external_api.metrics import track_upstream
+from external_api.models import CityLocation
+from external_api.resilience import get_upstream
+from external_api.sessions import get_timeout
+from weather.config import get_config
+
+logger = logging.getLogger('city_time_logger')
+
+CACHE_PREFIX = "location"
+
+_geolocator = None
+_timezone_finder = None
+# Блокировки по хэшу города: один город геокодируется одним потоком за раз
+_locks = [threading.Lock() for _ in range(64)]
+
+
+def _cache_key(city: str) -> str:
+    return f"{CACHE_PREFIX}:{city_key(city)}"
+
+
+def _cache_timeout() -> int:
+    return get_config().location_cache_timeout
+
+
+def _city_lock(city: str) -> threading.Lock:
+    return _locks[hash(city) % len(_locks)]
+
+
+def _get_geolocator():
+    """
+    Геокодер Nominatim. geopy импортируется при первом геокодировании, а не при запуске процесса
+    """
+    global _geolocator
+    if _geolocator is None:
+        from geopy.geocoders import Nominatim
+
+        config = get_config()
+        _geolocator = Nominatim(
+            user_agent="city_time_app",
+            timeout=get_timeout()[1],
+            domain=config.nominatim_domain,
+            scheme=config.nominatim_scheme,
+        )
+    return _geolocator
+
+
+def find_timezone(latitude: float, longitude: float) -> str | None:
+    """
+    Определение часового пояса по координатам без обращения к сети.
+    Требует установленного пакета timezonefinder, иначе возвращает None
+
+    :return: название часового пояса IANA (например, 'Europe/Moscow') or None
+    """
+    global _timezone_finder
+    if _timezone_finder is None:
+        try:
+            from timezonefinder import TimezoneFinder
+        except ImportError:  # необязательная зависимость
+            _timezone_finder = False
+        else:
+            _timezone_finder = TimezoneFinder()
+    if not _timezone_finder:
+        return None
+    return _timezone_finder.timezone_at(lng=longitude, lat=latitude)
+
+
+def _to_dict(location: CityLocation) -> dict:
+    return {
+        "latitude": location.latitude,
+        "longitude": location.longitude,
+        "timezone": location.timezone,
+    }
+
+
+def get_cached_location(city: str) -> dict | None:
+    """
+    Координаты и часовой пояс города только из кэша, без обращения к бд и Nominatim
+
+    :param city: название города
+    :return: dict or None, если города нет в кэше
+    """
+    return cache.get(_cache_key(city))
+
+
+def get_cached_locations(cities: list[str]) -> dict:
+    """
+    Координаты списка городов из кэша одним запросом
+
+    :param cities: list[str]
+    :return: dict: {city: location} только для закэшированных городов
+    """
+    cache_keys = {city: _cache_key(city) for city in cities}
+    found = cache.get_many(list(set(cache_keys.values())))
+    return {city: found[key] for city, key in cache_keys.items() if key in found}
+
+
+def get_location(city: str) -> dict | None:
+    """
+    Получение координат и часового пояса города.
+    Порядок поиска: кэш -> бд -> Nominatim. Найденный город сохраняется в бд и кэш,
+    поэтому геокодирование выполняется не больше одного раза на город
+
+    :param city: название города
+    :return: dict: {"latitude": 55.75, "longitude": 37.61, "timezone": "Europe/Moscow"} or None
+    """
+    location = get_cached_location(city)
+    if location is not None:
+        return location
+
+    key = _cache_key(city)
+    with _city_lock(key):
+        location = cache.get(key)
+        if location is not None:
+            return location
+
+        keys = city_keys(city)
+        stored = sorted(CityLocation.objects.filter(city__in=keys), key=lambda item: keys.index(item.city))
+        if stored:
+            stored = stored[0]
+            location = _to_dict(stored)
+            cache.set(key, location, timeout=_cache_timeout())
+            return location
+
+        with track_upstream("geocoding"):
+            found = get_upstream("geocoding", hedge=False).call(partial(_get_geolocator().geocode, city))
+        if not found:
+            return None
+        return save_location(city, found.latitude, found.longitude)
+
+
+def save_location(city: str, latitude: float, longitude: float, timezone: str = "") -> dict:
+    """
+    Сохранение координат города в бд и кэш
+
+    :return: dict
+    """
+    stored, _ = CityLocation.objects.update_or_create(
+        city=city_key(city),
+        defaults={"latitude": latitude, "longitude": longitude, "timezone": timezone},
+    )
+    location = _to_dict(stored)
+    cache.set(_cache_key(city), location, timeout=_cache_timeout())
+    return location
+
+
+def set_timezone(city: str, timezone: str) -> None:
+    """
+    Сохранение часового пояса для уже известного города
+    """
+    updated = CityLocation.objects.filter(city__in=city_keys(city)).exclude(timezone=timezone).update(
+        timezone=timezone
+    )
+    if updated:
+        cache.delete(_cache_key(city))
+
+
+def move_alias(alias: str, city_key: str) -> None:
+    """
+    Перенос координат, сохраненных по названию города (ключ alias), на канонический ключ города
+    """
+    if CityLocation.objects.filter(city=city_key).exists():
+        CityLocation.objects.filter(city=alias).delete()
+    elif CityLocation.objects.filter(city=alias).update(city=city_key):
+        cache.delete(f"{CACHE_PREFIX}:{city_key}")
+
+
+def alias_learned(sender, alias: str, city_key: str, **kwargs) -> None:
+    """
+    Перенос координат при появлении нового написания известного города (external_api.cities.alias_learned)
+    """
+    move_alias(alias, city_key)
+
+
+def preload_locations(rows, batch_size: int = 500) -> int:
+    """
+    Массовая загрузка координат городов.
+    Записи сохраняются по каноническому ключу города (как в save_location), существующие обновляются
+
+    :param rows: итерируемый набор словарей с ключами city, latitude, longitude и timezone (необязательно)
+    :param batch_size: размер пачки для записи в бд
+    :return: количество загруженных городов
+    """
+    total = 0
+    batch = {}
+    for row in rows:
+        location = CityLocation(
+            city=city_key(row["city"]),
+            latitude=float(row["latitude"]),
+            longitude=float(row["longitude"]),
+            timezone=row.get("timezone") or "",
+        )
+        # Повтор города внутри пачки заменяет предыдущую строку
+        batch[location.city] = location
+        if len(batch) >= batch_size:
+            total += _write_batch(list(batch.values()))
+            batch = {}
+
+    if batch:
+        total += _write_batch(list(batch.values()))
+
+    logger.info(f"Загружено городов: {total}")
+    return total
+
+
+def _write_batch(batch: list[CityLocation]) -> int:
+    CityLocation.objects.bulk_create(
+        batch,
+        update_conflicts=True,
+        unique_fields=["city"],
+        update_fields=["latitude", "longitude", "timezone"],
+    )
+    cache.delete_many([f"{CACHE_PREFIX}:{location.city}" for location in batch])
+    return len(batch)
@@ -0,0 +1,144 @@
+import logging
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+
+from weather.config import get_config
+
+logger = logging.getLogger('cache_logger')
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# Идентификатор процесса, чтобы не обрабатывать собственные сообщения об инвалидации
+_origin = uuid.uuid4().hex
+_local_cache = None
+_init_lock = threading.Lock()
+
+
+class LocalCache:
+    """
+    LRU-кэш в памяти процесса с ограничением по числу записей, объему и времени жизни записи
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, timeout: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._data: OrderedDict[str, tuple[float, int, object]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+
+            expires_at, size, value = item
+            if expires_at <= time.monotonic():
+                self._pop(key)
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, timeout: float = None) -> None:
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+
+        expires_at = time.monotonic() + (timeout or self.timeout)
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (expires_at, size, value)
+            self._size += size
+
+            while len(self._data) > self.max_entries or self._size > self.max_bytes:
+                self._pop(next(iter(self._data)))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+    def _pop(self, key: str) -> None:
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._size -= item[1]
+
+
+def _uses_redis() -> bool:
+    return settings.CACHES["default"]["BACKEND"].startswith("django_redis")
+
+
+def _listen_invalidations(local_cache: LocalCache) -> None:
+    """
+    Подписка на сообщения об инвалидации от других процессов через Redis pub/sub
+    """
+    from django_redis import get_redis_connection
+
+    while True:
+        try:
+            pubsub = get_redis_connection("default").pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            for message in pubsub.listen():
+                origin, _, key = message["data"].decode().partition(":")
+                if origin != _origin:
+                    local_cache.delete(key)
+        except Exception as e:
+            logger.warning(f"Подписка на инвалидацию кэша прервана: {e}")
+            # Пока подписки нет, сообщения теряются, поэтому локальный кэш сбрасывается целиком
+            local_cache.clear()
+            time.sleep(1)
+
+
+def get_local_cache() -> LocalCache | None:
+    """
+    Локальный кэш процесса (L1) перед Redis.
+    Возвращает None, если он выключен (CACHE_L1_ENABLED)
+    """
+    global _local_cache
+    config = get_config()
+    if _local_cache is not None or not config.cache_l1_enabled:
+        return _local_cache
+
+    with _init_lock:
+        if _local_cache is None:
+            local_cache = LocalCache(
+                max_entries=config.cache_l1_max_entries,
+                max_bytes=config.cache_l1_max_bytes,
+                timeout=config.cache_l1_timeout,
+            )
+            if _uses_redis():
+                threading.Thread(
+                    target=_listen_invalidations,
+                    args=(local_cache,),
+                    name="cache-invalidation",
+                    daemon=True
+                ).start()
+            _local_cache = local_cache
+
+    return _local_cache
+
+
+def publish_invalidation(key: str) -> None:
+    """
+    Оповещение других процессов об изменении ключа
+    """
+    if not _uses_redis():
+        return
+
+    from django_redis import get_redis_connection
+
+    try:
+        get_redis_connection("default").publish(INVALIDATION_CHANNEL, f"{_origin}:{key}")
+    except Exception as e:
+        logger.warning(f"Не удалось отправить инвалидацию {key}: {e}")
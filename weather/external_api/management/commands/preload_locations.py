@@ -0,0 +1,40 @@
+import csv
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from external_api.geocoding import preload_locations
+
+
+class Command(BaseCommand):
+    """
+    Загрузка координат городов из файла.
+    Поддерживаются CSV (колонки city, latitude, longitude, timezone) и JSON (список объектов с теми же полями)
+    """
+
+    help = "Загрузка координат и часовых поясов городов из CSV или JSON файла"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path, help="Путь к файлу .csv или .json")
+        parser.add_argument("--batch-size", type=int, default=500, help="Размер пачки для записи в бд")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not path.exists():
+            raise CommandError(f"Файл {path} не найден")
+
+        with path.open(encoding="utf-8") as file:
+            if path.suffix == ".json":
+                rows = json.load(file)
+            elif path.suffix == ".csv":
+                rows = csv.DictReader(file)
+            else:
+                raise CommandError("Поддерживаются только файлы .csv и .json")
+
+            try:
+                total = preload_locations(rows, batch_size=options["batch_size"])
+            except (KeyError, ValueError) as e:
+                raise CommandError(f"Некорректная строка в файле: {e}") from e
+
+        self.stdout.write(self.style.SUCCESS(f"Загружено городов: {total}"))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from external_api.fake_upstream import FakeUpstreamServer
+
+
+class Command(BaseCommand):
+    """
+    Запуск локальной замены OpenWeather, WorldTime и Nominatim.
+    Позволяет профилировать и нагружать сервис без доступа к сети
+    """
+
+    help = "Запуск локального сервера, имитирующего внешние API"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1", help="Адрес сервера")
+        parser.add_argument("--port", type=int, default=8010, help="Порт сервера")
+        parser.add_argument("--latency", type=float, default=0.05, help="Задержка ответа, секунды")
+        parser.add_argument("--jitter", type=float, default=0.0, help="Случайная добавка к задержке, секунды")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 503 (от 0 до 1)")
+        parser.add_argument("--rate-limit", type=float, default=0, help="Запросов в секунду, 0 - без ограничения")
+        parser.add_argument("--verbose-requests", action="store_true", help="Логировать каждый запрос")
+
+    def handle(self, *args, **options):
+        server = FakeUpstreamServer(
+            (options["host"], options["port"]),
+            latency=options["latency"],
+            jitter=options["jitter"],
+            error_rate=options["error_rate"],
+            rate_limit=options["rate_limit"],
+            verbose=options["verbose_requests"],
+        )
+
+        self.stdout.write(f"Сервер запущен на {server.url}. Переменные окружения для сервиса:")
+        for name, value in server.env().items():
+            self.stdout.write(f"{name}={value}")
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,57 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from external_api.openweathermap_client import OpenWeatherClient
+from external_api.warmup import decay_popularity, top_cities
+
+logger = logging.getLogger('cache_logger')
+
+
+class Command(BaseCommand):
+    """
+    Планировщик прогрева кэша.
+    Для самых запрашиваемых городов обновляет текущую погоду и прогноз незадолго до истечения записи в кэше.
+    Обновления распределяются во времени, чтобы не превышать лимит запросов к OpenWeather
+    """
+
+    help = "Прогрев кэша погоды для самых запрашиваемых городов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=100, help="Количество самых запрашиваемых городов")
+        parser.add_argument("--lead", type=float, default=60,
+                            help="За сколько секунд до истечения свежести обновлять запись")
+        parser.add_argument("--interval", type=float, default=30, help="Пауза между проходами, секунды")
+        parser.add_argument("--rate", type=float, default=1, help="Не больше запросов к API в секунду")
+        parser.add_argument("--decay-every", type=int, default=120,
+                            help="Уменьшать счетчики популярности каждые N проходов (0 - не уменьшать)")
+        parser.add_argument("--once", action="store_true", help="Выполнить один проход и завершиться")
+
+    def handle(self, *args, **options):
+        client = OpenWeatherClient()
+        methods = (OpenWeatherClient.get_current_weather, OpenWeatherClient.get_forecast)
+        pause = 1 / options["rate"]
+        passes = 0
+
+        while True:
+            refreshed = 0
+            for city in top_cities(options["top"]):
+                for method in methods:
+                    fresh_for = method.fresh_for(city)
+                    if fresh_for is not None and fresh_for > options["lead"]:
+                        continue
+                    try:
+                        method.refresh(client, city)
+                        refreshed += 1
+                    except Exception as e:
+                        logger.warning(f"Не удалось прогреть {method.__name__} для '{city}': {e}")
+                    time.sleep(pause)
+
+            passes += 1
+            self.stdout.write(f"Проход {passes}: обновлено записей: {refreshed}")
+            if options["decay_every"] and passes % options["decay_every"] == 0:
+                decay_popularity()
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,207 @@
+import abc
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from external_api.timing import phase
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: list["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, *extra: str) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(abc.ABC):
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    @abc.abstractmethod
+    def samples(self, process: str) -> list[str]:
+        """
+        Строки значений метрики
+
+        :param process: метка процесса, добавляется к каждому значению (pid="123")
+        """
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        """
+        Обнуление значений метрики
+        """
+
+
+class Counter(_Metric):
+    """
+    Монотонно растущий счетчик с метками
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self, process: str) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, labels, process)} {value}" for labels, value in values]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(_Metric):
+    """
+    Гистограмма значений (задержек) с метками
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        # метки -> [счетчики по корзинам (последняя - +Inf), сумма]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            item = self._values.get(labels)
+            if item is None:
+                item = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            item[0][index] += 1
+            item[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        """
+        Замер длительности блока
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def count(self, *labels) -> int:
+        item = self._values.get(labels)
+        return sum(item[0]) if item else 0
+
+    def samples(self, process: str) -> list[str]:
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+
+        lines = []
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le, process)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels, process)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels, process)} {cumulative}")
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+def render() -> str:
+    """
+    Все метрики процесса в текстовом формате Prometheus.
+    Значения хранятся в памяти процесса, поэтому каждое помечено меткой pid:
+    значения разных воркеров не смешиваются и суммируются на стороне Prometheus
+    """
+    # pid читается при отрисовке, а не при импорте: воркеры создаются fork после загрузки модулей
+    process = f'pid="{os.getpid()}"'
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.samples(process))
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    """
+    Обнуление всех метрик процесса
+    """
+    for metric in _registry:
+        metric.clear()
+
+
+CACHE_REQUESTS = Counter(
+    "weather_cache_requests_total",
+    "Обращения к кэшу данных погоды по префиксу: hit, stale (устаревшее значение) или miss",
+    ("prefix", "result"),
+)
+UPSTREAM_DURATION = Histogram(
+    "weather_upstream_request_duration_seconds",
+    "Длительность запросов к внешним API",
+    ("service",),
+)
+UPSTREAM_ERRORS = Counter(
+    "weather_upstream_errors_total",
+    "Ошибки внешних API по типу: класс исключения или http_<статус>",
+    ("service", "type"),
+)
+DB_DURATION = Histogram(
+    "weather_db_query_duration_seconds",
+    "Длительность запросов к бд прогнозов, сохраненных вручную",
+    ("operation",),
+)
+
+
+@contextmanager
+def track_upstream(service: str):
+    """
+    Замер длительности запроса к внешнему API и учет исключений по типу
+
+    :param service: openweather, worldtime или geocoding
+    """
+    started = time.perf_counter()
+    try:
+        with phase(service):
+            yield
+    except Exception as e:
+        UPSTREAM_ERRORS.inc(service, type(e).__name__)
+        raise
+    finally:
+        UPSTREAM_DURATION.observe(time.perf_counter() - started, service)
+
+
+@contextmanager
+def track_db(operation: str):
+    """
+    Замер длительности запроса к бд прогнозов
+    """
+    with phase("db"), DB_DURATION.time(operation):
+        yield
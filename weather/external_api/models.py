@@ -1,3 +1,19 @@
 from django.db import models
 
-# Create your models here.
+
+class CityLocation(models.Model):
+    """
+    Модель для хранения координат и часового пояса городов
+    """
+    city = models.CharField(max_length=100, unique=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    timezone = models.CharField(max_length=64, blank=True, default="")
+
+
+class CityAlias(models.Model):
+    """
+    Модель для хранения написаний названия города и идентификатора города в OpenWeather
+    """
+    alias = models.CharField(max_length=100, unique=True)
+    city_id = models.IntegerField(db_index=True)
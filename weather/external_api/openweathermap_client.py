@@ -1,14 +1,24 @@
 import logging
-import os
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from functools import partial
 
-import dotenv
 import requests
 
+from external_api.cities import (
+    CityNotFoundError,
+    city_query,
+    is_city_not_found,
+    mark_city_not_found,
+    remember_city
+)
 from external_api.decorators import cached_data
+from external_api.forecast import DailyForecast
+from external_api.metrics import UPSTREAM_ERRORS, track_upstream
+from external_api.resilience import get_upstream
+from external_api.sessions import get_session, get_timeout
+from weather.config import get_config
 
 logger = logging.getLogger('openweathermap_logger')
-dotenv.load_dotenv()
 
 
 class OpenWeatherClientError(Exception):
@@ -18,14 +28,45 @@ class OpenWeatherClientError(Exception):
     pass
 
 
+class OpenWeatherCityNotFoundError(OpenWeatherClientError, CityNotFoundError):
+    """
+    Город не найден в OpenWeather
+    """
+    pass
+
+
 class OpenWeatherClient:
     """
     Класс для взаимодействия с API OpenWeather
     """
 
     def __init__(self):
-        self.base_url = os.getenv("OPENWEATHER_BASE_URL")
-        self.api_key = os.getenv("OPENWEATHER_API_KEY")
+        config = get_config()
+        self.base_url = config.openweather_base_url
+        self.api_key = config.openweather_api_key
+        self.session = get_session(self.base_url)
+
+    @staticmethod
+    def _check_city(city: str) -> None:
+        """
+        Ответ из кэша, если город недавно не нашелся
+        """
+        if is_city_not_found(city, "openweather"):
+            raise OpenWeatherCityNotFoundError("Ошибка API: city not found")
+
+    @staticmethod
+    def _raise_for_status(city: str, response) -> None:
+        """
+        Ошибка для ответа API с кодом, отличным от 200.
+        Результат "город не найден" (404) кэшируется
+        """
+        UPSTREAM_ERRORS.inc("openweather", f"http_{response.status_code}")
+        logger.error(f"Ошибка API: {response.text}")
+        message = f"Ошибка API: {response.json()['message']}"
+        if response.status_code == 404:
+            mark_city_not_found(city, "openweather")
+            raise OpenWeatherCityNotFoundError(message)
+        raise OpenWeatherClientError(message)
 
     @cached_data("current_weather")
     def get_current_weather(self, city: str) -> float:
@@ -35,17 +76,21 @@ class OpenWeatherClient:
         :param city: str
         :return: float
         """
+        self._check_city(city)
         try:
-            response = requests.get(
-                f"{self.base_url}/weather",
-                params={"q": city, "appid": self.api_key, "units": "metric"}
-            )
+            with track_upstream("openweather"):
+                response = get_upstream("openweather").call(partial(
+                    self.session.get,
+                    f"{self.base_url}/weather",
+                    params={**city_query(city), "appid": self.api_key, "units": "metric"},
+                    timeout=get_timeout()
+                ))
             data = response.json()
 
             if response.status_code != 200:
-                logger.error(f"Ошибка API: {response.text}")
-                raise OpenWeatherClientError(f"Ошибка API: {response.json()['message']}")
+                self._raise_for_status(city, response)
 
+            remember_city(data["id"], city, data["name"])
             temperature = data["main"]["temp"]
 
             return temperature
@@ -54,35 +99,40 @@ class OpenWeatherClient:
             logger.error(e)
             raise OpenWeatherClientError("Ошибка соединения") from e
 
-    @cached_data("forecast")
-    def get_forecast(self, city: str) -> dict:
+    def get_cached_current_weather(self, cities: list[str]) -> dict:
+        """
+        Текущая погода из кэша для списка городов одним запросом к кэшу
+
+        :param cities: list[str]
+        :return: dict: {city: temperature} только для закэшированных городов
+        """
+        return OpenWeatherClient.get_current_weather.get_cached_many(self, cities)
+
+    @cached_data("daily_forecast")
+    def get_forecast(self, city: str) -> DailyForecast:
         """
         Получение прогноза погоды на указанный город на 30 дней
 
         :param city:
-        :return: dict
+        :return: DailyForecast: минимум, максимум и среднее по дням
         """
+        self._check_city(city)
         try:
-            response = requests.get(
-                f"{self.base_url}/forecast",
-                params={"q": city, "appid": self.api_key, "units": "metric"}
-            )
+            with track_upstream("openweather"):
+                response = get_upstream("openweather").call(partial(
+                    self.session.get,
+                    f"{self.base_url}/forecast",
+                    params={**city_query(city), "appid": self.api_key, "units": "metric"},
+                    timeout=get_timeout()
+                ))
             data = response.json()
             logger.info(data)
 
             if response.status_code != 200:
-                logger.error(f"Ошибка API: {response.text}")
-                raise OpenWeatherClientError(f"Ошибка API: {response.json()['message']}")
-
-            forecast_list = data["list"]
-            forecast = {day['dt_txt'].split()[0]: {
-                'min_temperature': day['main']['temp_min'],
-                'max_temperature': day['main']['temp_max'],
-            }
-                for day in forecast_list
-            }
+                self._raise_for_status(city, response)
 
-            return forecast
+            remember_city(data["city"]["id"], city, data["city"]["name"])
+            return DailyForecast.from_slots(data["list"])
 
         except requests.RequestException as e:
             logger.error(e)
@@ -100,5 +150,23 @@ class OpenWeatherClient:
                         "max_temperature": 24.5
                         }
         """
+        return self.get_forecast(city).get(date)
+
+    def get_forecast_by_dates(self, city: str, date_from: date, date_to: date) -> dict[date, dict]:
+        """
+        Получение прогноза погоды на указанный город за период
+
+        :param city: str
+        :param date_from: начало периода (включительно)
+        :param date_to: конец периода (включительно)
+        :return: dict: {date: {"min_temperature": 11.1, "max_temperature": 24.5}}, только дни с прогнозом
+        """
         forecast_data = self.get_forecast(city)
-        return forecast_data.get(str(date))
+        result = {}
+        day = date_from
+        while day <= date_to:
+            forecast = forecast_data.get(day)
+            if forecast:
+                result[day] = forecast
+            day += timedelta(days=1)
+        return result
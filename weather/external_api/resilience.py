@@ -0,0 +1,233 @@
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+
+from external_api.metrics import Counter
+from weather.config import get_config
+
+logger = logging.getLogger('cache_logger')
+
+CIRCUIT_REJECTED = Counter(
+    "weather_circuit_rejected_total",
+    "Запросы к внешним API, отклоненные открытым автоматическим выключателем",
+    ("service",),
+)
+HEDGED_REQUESTS = Counter(
+    "weather_hedged_requests_total",
+    "Повторные (hedged) запросы к внешним API и чей ответ использован: primary или hedge",
+    ("service", "winner"),
+)
+
+_upstreams: dict[str, "Upstream"] = {}
+_upstreams_lock = threading.Lock()
+_hedge_executor = None
+# Результат повторного запроса, который не понадобилось отправлять
+_NOT_SENT = object()
+
+
+class CircuitOpen(requests.RequestException):
+    """
+    Внешний API временно отключен автоматическим выключателем
+    """
+    pass
+
+
+def _is_failure(response) -> bool:
+    return isinstance(response, requests.Response) and (response.status_code >= 500 or response.status_code == 429)
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель для внешнего API.
+    После failure_threshold ошибок подряд запросы отклоняются (CircuitOpen) в течение recovery_timeout секунд,
+    затем пропускается один пробный запрос: при успехе выключатель закрывается, при ошибке снова открывается.
+    Ошибкой считается исключение или ответ 5xx/429
+    """
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def before_call(self) -> None:
+        """
+        Проверка перед запросом, выбрасывает CircuitOpen, если запрос выполнять нельзя
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if not self._probing and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                self._probing = True
+                return
+
+        CIRCUIT_REJECTED.inc(self.name)
+        raise CircuitOpen(f"{self.name} временно недоступен")
+
+    def record(self, failed: bool) -> None:
+        with self._lock:
+            self._probing = False
+            if not failed:
+                if self.opened_at is not None:
+                    logger.info(f"Выключатель {self.name} закрыт")
+                self.failures = 0
+                self.opened_at = None
+                return
+
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"Выключатель {self.name} открыт после {self.failures} ошибок подряд")
+                self.opened_at = time.monotonic()
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _upstreams_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(
+                    max_workers=get_config().hedge_workers,
+                    thread_name_prefix="upstream-hedge"
+                )
+    return _hedge_executor
+
+
+def _close(future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        response = future.result()
+        if isinstance(response, requests.Response):
+            response.close()
+
+
+def _hedge_result(future: Future):
+    """
+    Ответ повторного запроса или _NOT_SENT, если он не отправлялся или завершился ошибкой
+    """
+    if future.exception() is not None:
+        return _NOT_SENT
+    return future.result()
+
+
+class Upstream:
+    """
+    Защита вызовов внешнего API: автоматический выключатель и, при hedge=True, повторный запрос,
+    если ответ не пришел за HEDGE_PERCENTILE-перцентиль недавних задержек (не меньше HEDGE_MIN_DELAY секунд).
+    Основной запрос выполняется в потоке вызывающего, в пул HEDGE_WORKERS уходят только ожидание и повторный запрос.
+    Ответ повторного запроса используется, если основной завершился ошибкой
+    """
+
+    # Минимальное количество замеров задержки для расчета порога повторного запроса
+    min_samples = 20
+
+    def __init__(self, name: str, hedge: bool):
+        config = get_config()
+        self.name = name
+        self.breaker = CircuitBreaker(
+            name,
+            failure_threshold=config.circuit_failure_threshold,
+            recovery_timeout=config.circuit_recovery_timeout,
+        )
+        self.hedge = hedge and config.hedge_enabled
+        self.hedge_percentile = config.hedge_percentile
+        self.hedge_min_delay = config.hedge_min_delay
+        self._latencies: deque[float] = deque(maxlen=200)
+
+    def hedge_delay(self) -> float | None:
+        """
+        Задержка перед повторным запросом или None, если замеров пока недостаточно
+        """
+        latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100))
+        return max(latencies[index], self.hedge_min_delay)
+
+    def call(self, send: Callable):
+        """
+        Выполнение запроса
+
+        :param send: функция без аргументов, выполняющая запрос
+        :return: результат send
+        """
+        self.breaker.before_call()
+
+        started = time.monotonic()
+        try:
+            result = self._send_hedged(send) if self.hedge else send()
+        except Exception:
+            self.breaker.record(failed=True)
+            raise
+
+        failed = _is_failure(result)
+        self.breaker.record(failed=failed)
+        if not failed:
+            self._latencies.append(time.monotonic() - started)
+        return result
+
+    def _send_hedged(self, send: Callable):
+        delay = self.hedge_delay()
+        if delay is None:
+            return send()
+
+        primary_done = threading.Event()
+
+        def hedge():
+            if primary_done.wait(delay):
+                return _NOT_SENT
+            return send()
+
+        hedged = _get_hedge_executor().submit(hedge)
+        try:
+            result = send()
+        except Exception:
+            primary_done.set()
+            backup = _hedge_result(hedged)
+            if backup is _NOT_SENT or _is_failure(backup):
+                raise
+            HEDGED_REQUESTS.inc(self.name, "hedge")
+            return backup
+        primary_done.set()
+
+        if _is_failure(result):
+            backup = _hedge_result(hedged)
+            if backup is not _NOT_SENT and not _is_failure(backup):
+                result.close()
+                HEDGED_REQUESTS.inc(self.name, "hedge")
+                return backup
+
+        def finish(future):
+            if future.exception() is None and future.result() is not _NOT_SENT:
+                HEDGED_REQUESTS.inc(self.name, "primary")
+            _close(future)
+
+        hedged.add_done_callback(finish)
+        return result
+
+
+def get_upstream(name: str, hedge: bool = True) -> Upstream:
+    """
+    Общая для процесса защита вызовов внешнего API
+
+    :param name: openweather, worldtime или geocoding
+    :param hedge: разрешить повторные запросы (только для идемпотентных запросов)
+    """
+    upstream = _upstreams.get(name)
+    if upstream is None:
+        with _upstreams_lock:
+            upstream = _upstreams.get(name)
+            if upstream is None:
+                upstream = _upstreams[name] = Upstream(name, hedge)
+    return upstream
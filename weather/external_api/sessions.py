@@ -0,0 +1,59 @@
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from weather.config import get_config
+
+_sessions: dict[str, requests.Session] = {}
+_lock = threading.Lock()
+
+
+def get_timeout() -> tuple[float, float]:
+    """
+    Таймауты (connect, read) для запросов к внешним API
+    """
+    config = get_config()
+    return config.http_connect_timeout, config.http_read_timeout
+
+
+def _build_session() -> requests.Session:
+    """
+    Создание сессии с пулом соединений и повторными попытками
+    """
+    config = get_config()
+    retry = Retry(
+        total=config.http_retries,
+        backoff_factor=config.http_backoff_factor,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.http_pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session(url: str) -> requests.Session:
+    """
+    Получение общей для процесса сессии для хоста из url.
+    Соединения переиспользуются между запросами (keep-alive)
+
+    :param url: адрес внешнего API
+    :return: requests.Session
+    """
+    parts = urlsplit(url or "")
+    host = f"{parts.scheme}://{parts.netloc}"
+
+    session = _sessions.get(host)
+    if session is None:
+        with _lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = _sessions[host] = _build_session()
+    return session
@@ -0,0 +1,58 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+
+# Длительности этапов текущего запроса: название -> [сумма в секундах, количество]
+_timings: ContextVar[dict | None] = ContextVar("request_timings", default=None)
+_lock = threading.Lock()
+
+
+def start_request() -> Token:
+    """
+    Начало сбора длительностей этапов для текущего запроса
+    """
+    return _timings.set({})
+
+
+def finish_request(token: Token) -> dict[str, list]:
+    """
+    Окончание сбора длительностей этапов
+
+    :return: dict: {"openweather": [0.12, 1]}
+    """
+    timings = _timings.get() or {}
+    _timings.reset(token)
+    return timings
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Замер этапа обработки запроса (auth, validation, cache, db, openweather, ...).
+    Вне запроса ничего не делает. Контекст передается в потоки пула запросов к внешним API,
+    поэтому этапы, выполняемые параллельно, тоже учитываются
+    """
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            entry = timings.setdefault(name, [0.0, 0])
+            entry[0] += elapsed
+            entry[1] += 1
+
+
+def server_timing(timings: dict[str, list], total: float) -> str:
+    """
+    Значение заголовка Server-Timing, длительности в миллисекундах
+    """
+    parts = [f"{name};dur={duration * 1000:.1f}" for name, (duration, _) in timings.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
@@ -0,0 +1,76 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+from external_api.cities import normalize_city
+from weather.config import get_config
+
+logger = logging.getLogger('cache_logger')
+
+POPULARITY_KEY = "city_popularity"
+
+_counts: Counter = Counter()
+_counts_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def _redis():
+    if not settings.CACHES["default"]["BACKEND"].startswith("django_redis"):
+        return None
+
+    from django_redis import get_redis_connection
+    return get_redis_connection("default")
+
+
+def track_city(city: str) -> None:
+    """
+    Учет запроса погоды для города.
+    Счетчики копятся в процессе и сбрасываются в Redis раз в CITY_TRACKING_FLUSH_INTERVAL секунд.
+    Без Redis статистика доступна только внутри процесса
+    """
+    global _flushed_at
+    now = time.monotonic()
+    redis = _redis()
+    with _counts_lock:
+        _counts[normalize_city(city)] += 1
+        if redis is None or now - _flushed_at < get_config().city_tracking_flush_interval:
+            return
+        counts = dict(_counts)
+        _counts.clear()
+        _flushed_at = now
+
+    try:
+        pipeline = redis.pipeline(transaction=False)
+        for name, count in counts.items():
+            pipeline.zincrby(POPULARITY_KEY, count, name)
+        pipeline.execute()
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить статистику запросов: {e}")
+
+
+def top_cities(limit: int) -> list[str]:
+    """
+    Самые запрашиваемые города
+
+    :param limit: количество городов
+    :return: список нормализованных названий, самые популярные первыми
+    """
+    redis = _redis()
+    if redis is None:
+        with _counts_lock:
+            return [name for name, _ in _counts.most_common(limit)]
+    return [name.decode() for name in redis.zrevrange(POPULARITY_KEY, 0, limit - 1)]
+
+
+def decay_popularity(factor: float = 0.5) -> None:
+    """
+    Уменьшение накопленных счетчиков, чтобы старые запросы весили меньше новых
+    """
+    redis = _redis()
+    if redis is None:
+        return
+    redis.zunionstore(POPULARITY_KEY, {POPULARITY_KEY: factor})
+    redis.zremrangebyscore(POPULARITY_KEY, "-inf", 0.5)
@@ -1,11 +1,16 @@
 import logging
-import os
+from datetime import datetime
+from functools import partial
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-import dotenv
 import requests
-from geopy.geocoders import Nominatim
 
-dotenv.load_dotenv()
+from external_api.cities import CityNotFoundError, is_city_not_found, mark_city_not_found
+from external_api.geocoding import find_timezone, get_cached_location, get_location, set_timezone
+from external_api.metrics import UPSTREAM_ERRORS, track_upstream
+from external_api.resilience import get_upstream
+from external_api.sessions import get_session, get_timeout
+from weather.config import get_config
 
 logger = logging.getLogger('city_time_logger')
 
@@ -17,47 +22,101 @@ class CityTimeClientError(Exception):
     pass
 
 
+class CityTimeCityNotFoundError(CityTimeClientError, CityNotFoundError):
+    """
+    Город не найден геокодером
+    """
+    pass
+
+
 class CityTimeClient:
     """
     Класс для получения текущего времени в заданном городе
     """
 
     def __init__(self):
-        self.api_key = os.getenv("WORLD_TIME_API_KEY")
-        self.api_url = os.getenv("WORLD_TIME_API_URL",)
+        config = get_config()
+        self.api_key = config.world_time_api_key
+        self.api_url = config.world_time_api_url
+        self.session = get_session(self.api_url)
+        self.mode = config.time_resolution_mode
 
-    def get_time(self, city: str) -> str:
+    def get_time(self, city: str, location: dict | None = None) -> str:
         """
         Получение локального времени указанного города
 
         :param city: Название города (например, 'London', 'Moscow')
+        :param location: координаты города, если они уже прочитаны из кэша (get_cached_locations)
         :return: строка времени в формате HH:MM
         """
         try:
-            geolocator = Nominatim(user_agent="city_time_app")
-            location = geolocator.geocode(city)
+            if location is None:
+                location = get_cached_location(city)
+            if location is None:
+                # Отметка "не найден" проверяется только при промахе: у известного города ее нет
+                if is_city_not_found(city, "geocoding"):
+                    raise CityTimeCityNotFoundError(f"Город '{city}' не найден.")
+                location = get_location(city)
 
             if not location:
                 logger.error(f"Город '{city}' не найден.")
-                raise CityTimeClientError(f"Город '{city}' не найден.")
-
-            lat = location.latitude
-            lon = location.longitude
-
-            response = requests.get(
-                self.api_url,
-                headers={"X-Api-Key": self.api_key},
-                params={"lat": lat, "lon": lon}
-            )
+                mark_city_not_found(city, "geocoding")
+                raise CityTimeCityNotFoundError(f"Город '{city}' не найден.")
+
+            if self.mode == "offline":
+                local_time = self.get_offline_time(city, location)
+                if local_time:
+                    return local_time
+
+            lat = location["latitude"]
+            lon = location["longitude"]
+
+            with track_upstream("worldtime"):
+                response = get_upstream("worldtime").call(partial(
+                    self.session.get,
+                    self.api_url,
+                    headers={"X-Api-Key": self.api_key},
+                    params={"lat": lat, "lon": lon},
+                    timeout=get_timeout()
+                ))
 
             if response.status_code != 200:
+                UPSTREAM_ERRORS.inc("worldtime", f"http_{response.status_code}")
                 logger.error(f"Ошибка API: {response.status_code} – {response.text}")
                 raise CityTimeClientError(f"Ошибка API: {response.json()['message'] }")
 
             data = response.json()
+            if data.get("timezone") and data["timezone"] != location["timezone"]:
+                set_timezone(city, data["timezone"])
+
             time_str = data.get("datetime", "").split()[1].rsplit(":", 1)[0]
             return time_str
 
         except requests.RequestException as e:
             logger.error(f"Ошибка соединения: {e}")
             raise CityTimeClientError("Ошибка соединения") from e
+
+    @staticmethod
+    def get_offline_time(city: str, location: dict) -> str | None:
+        """
+        Вычисление локального времени по часовому поясу города без запроса к WorldTime.
+        Если часовой пояс неизвестен, он определяется по координатам и сохраняется
+
+        :param city: Название города
+        :param location: координаты и часовой пояс города из get_location
+        :return: строка времени в формате HH:MM или None, если часовой пояс определить не удалось
+        """
+        timezone_name = location["timezone"] or find_timezone(location["latitude"], location["longitude"])
+        if not timezone_name:
+            return None
+
+        try:
+            zone = ZoneInfo(timezone_name)
+        except (ZoneInfoNotFoundError, ValueError):
+            logger.warning(f"Неизвестный часовой пояс '{timezone_name}' для города '{city}'")
+            return None
+
+        if not location["timezone"]:
+            set_timezone(city, timezone_name)
+
+        return datetime.now(zone).strftime("%H:%M")
@@ -0,0 +1,163 @@
+import os
+from dataclasses import dataclass
+
+import dotenv
+
+_config = None
+
+
+def _int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+def _float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+def _flag(name: str, default: bool) -> bool:
+    return os.getenv(name, "1" if default else "0") == "1"
+
+
+@dataclass(frozen=True)
+class Config:
+    """
+    Настройки сервиса из переменных окружения и файла .env.
+    Читаются один раз при запуске (get_config), а не на каждый запрос
+    """
+
+    # Внешние API
+    openweather_base_url: str | None
+    openweather_api_key: str | None
+    world_time_api_url: str | None
+    world_time_api_key: str | None
+    time_resolution_mode: str
+    nominatim_domain: str
+    nominatim_scheme: str
+
+    # HTTP-клиент
+    http_connect_timeout: float
+    http_read_timeout: float
+    http_pool_size: int
+    http_retries: int
+    http_backoff_factor: float
+
+    # Кэш, секунды
+    cache_timeout: int
+    cache_stale_timeout: int
+    cache_lock_timeout: int
+    cache_lock_wait: float
+    location_cache_timeout: int
+    city_alias_cache_timeout: int
+    city_not_found_cache_timeout: int
+    city_tracking_flush_interval: float
+    hand_forecast_index_ttl: int
+    response_cache_enabled: bool
+    response_cache_timeout: int
+    http_cache_public: bool
+    cache_l1_enabled: bool
+    cache_l1_max_entries: int
+    cache_l1_max_bytes: int
+    cache_l1_timeout: float
+
+    # Пулы потоков
+    cache_refresh_workers: int
+    hedge_workers: int
+    batch_workers: int
+    current_weather_workers: int
+
+    # Устойчивость к сбоям внешних API
+    circuit_failure_threshold: int
+    circuit_recovery_timeout: float
+    hedge_enabled: bool
+    hedge_percentile: float
+    hedge_min_delay: float
+
+    # API
+    delta_days: int
+    batch_max_cities: int
+    auth_users_cache_timeout: float
+    metrics_token: str | None
+    jwt_stateless: bool
+
+    # Профилирование
+    server_timing_enabled: bool
+    profile_sample_rate: float
+    profile_token: str | None
+    profile_dir: str | None
+
+    @classmethod
+    def from_env(cls) -> "Config":
+        return cls(
+            openweather_base_url=os.getenv("OPENWEATHER_BASE_URL"),
+            openweather_api_key=os.getenv("OPENWEATHER_API_KEY"),
+            world_time_api_url=os.getenv("WORLD_TIME_API_URL"),
+            world_time_api_key=os.getenv("WORLD_TIME_API_KEY"),
+            time_resolution_mode=os.getenv("TIME_RESOLUTION_MODE", "offline"),
+            nominatim_domain=os.getenv("NOMINATIM_DOMAIN", "nominatim.openstreetmap.org"),
+            nominatim_scheme=os.getenv("NOMINATIM_SCHEME", "https"),
+
+            http_connect_timeout=_float("HTTP_CONNECT_TIMEOUT", 3.05),
+            http_read_timeout=_float("HTTP_READ_TIMEOUT", 10),
+            http_pool_size=_int("HTTP_POOL_SIZE", 10),
+            http_retries=_int("HTTP_RETRIES", 2),
+            http_backoff_factor=_float("HTTP_BACKOFF_FACTOR", 0.3),
+
+            cache_timeout=_int("CACHE_TIMEOUT", 600),
+            cache_stale_timeout=_int("CACHE_STALE_TIMEOUT", 0),
+            cache_lock_timeout=_int("CACHE_LOCK_TIMEOUT", 30),
+            cache_lock_wait=_float("CACHE_LOCK_WAIT", 10),
+            location_cache_timeout=_int("LOCATION_CACHE_TIMEOUT", 60 * 60 * 24 * 30),
+            city_alias_cache_timeout=_int("CITY_ALIAS_CACHE_TIMEOUT", 60 * 60 * 24 * 30),
+            city_not_found_cache_timeout=_int("CITY_NOT_FOUND_CACHE_TIMEOUT", 300),
+            city_tracking_flush_interval=_float("CITY_TRACKING_FLUSH_INTERVAL", 10),
+            hand_forecast_index_ttl=_int("HAND_FORECAST_INDEX_TTL", 60 * 60 * 24),
+            response_cache_enabled=_flag("RESPONSE_CACHE_ENABLED", True),
+            response_cache_timeout=_int("RESPONSE_CACHE_TIMEOUT", 60),
+            http_cache_public=_flag("HTTP_CACHE_PUBLIC", False),
+            cache_l1_enabled=_flag("CACHE_L1_ENABLED", False),
+            cache_l1_max_entries=_int("CACHE_L1_MAX_ENTRIES", 1000),
+            cache_l1_max_bytes=_int("CACHE_L1_MAX_BYTES", 10 * 1024 * 1024),
+            cache_l1_timeout=_float("CACHE_L1_TIMEOUT", 30),
+
+            cache_refresh_workers=_int("CACHE_REFRESH_WORKERS", 4),
+            hedge_workers=_int("HEDGE_WORKERS", 8),
+            batch_workers=_int("BATCH_WORKERS", 16),
+            current_weather_workers=_int("CURRENT_WEATHER_WORKERS", 8),
+
+            circuit_failure_threshold=_int("CIRCUIT_FAILURE_THRESHOLD", 5),
+            circuit_recovery_timeout=_float("CIRCUIT_RECOVERY_TIMEOUT", 30),
+            hedge_enabled=_flag("HEDGE_ENABLED", False),
+            hedge_percentile=_float("HEDGE_PERCENTILE", 95),
+            hedge_min_delay=_float("HEDGE_MIN_DELAY", 0.05),
+
+            delta_days=_int("DELTA_DAYS", 10),
+            batch_max_cities=_int("BATCH_MAX_CITIES", 500),
+            auth_users_cache_timeout=_float("AUTH_USERS_CACHE_TIMEOUT", 30),
+            metrics_token=os.getenv("METRICS_TOKEN") or None,
+            jwt_stateless=_flag("JWT_STATELESS", True),
+
+            server_timing_enabled=_flag("SERVER_TIMING_ENABLED", True),
+            profile_sample_rate=_float("PROFILE_SAMPLE_RATE", 0),
+            profile_token=os.getenv("PROFILE_TOKEN") or None,
+            profile_dir=os.getenv("PROFILE_DIR") or None,
+        )
+
+
+def get_config() -> Config:
+    """
+    Настройки процесса (файл .env загружается при первом обращении)
+    """
+    global _config
+    if _config is None:
+        dotenv.load_dotenv()
+        _config = Config.from_env()
+    return _config
+
+
+def reload_config() -> Config:
+    """
+    Повторное чтение настроек после изменения окружения (локальная замена внешних API, тесты)
+    """
+    global _config
+    _config = None
+    return get_config()
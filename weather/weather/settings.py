@@ -3,9 +3,10 @@ import os
 from datetime import timedelta
 from pathlib import Path
 
-import dotenv
+from weather.config import get_config
 
-dotenv.load_dotenv()
+# Загрузка .env (один раз для всего процесса) и проверка настроек сервиса
+get_config()
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -38,6 +39,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -156,6 +158,12 @@ LOGGING = {
             'filename': os.path.join(BASE_DIR, 'logs/city_time_logger.log'),
             'formatter': 'verbose'
         },
+        'cache_handler': {
+            'level': 'DEBUG',
+            'class': 'logging.FileHandler',
+            'filename': os.path.join(BASE_DIR, 'logs/cache.log'),
+            'formatter': 'verbose'
+        },
 
     },
     'loggers': {
@@ -174,6 +182,12 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': True,
         },
+        # Кэш, прогрев, индекс прогнозов и автоматический выключатель внешних API
+        'cache_logger': {
+            'handlers': ['cache_handler'],
+            'level': 'DEBUG',
+            'propagate': True,
+        },
     },
 }
 
@@ -188,8 +202,15 @@ CACHES = {
 }
 
 REST_FRAMEWORK = {
+    # JWT_STATELESS=1: пользователь берется из токена без запроса к бд на каждый запрос
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.StatelessJWTAuthentication'
+        if get_config().jwt_stateless
+        else 'api.authentication.TimedJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     )
 }
 
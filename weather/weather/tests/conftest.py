@@ -1,6 +1,12 @@
 import pytest
 from rest_framework.test import APIClient
 from django.contrib.auth.models import User
+from django.core.cache import cache
+
+from api.authentication import user_status
+from api.index import hand_forecast_index
+from external_api import cities, metrics, resilience, warmup
+from weather.config import reload_config
 
 
 @pytest.fixture
@@ -11,3 +17,39 @@ def api_client():
 @pytest.fixture
 def user(db):
     return User.objects.create_user(username="testuser", password="testpass")
+
+
+@pytest.fixture
+def env(monkeypatch):
+    """
+    Установка переменных окружения с повторным чтением настроек сервиса
+    """
+    def setenv(**values):
+        for name, value in values.items():
+            monkeypatch.setenv(name, value)
+        reload_config()
+
+    return setenv
+
+
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    """
+    Кэш в памяти процесса вместо Redis и сброс состояния модулей между тестами
+    """
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+    cache.clear()
+    cities._aliases.clear()
+    hand_forecast_index._local.clear()
+    hand_forecast_index._checked_at = None
+    hand_forecast_index._missed_add = False
+    warmup._counts.clear()
+    metrics.reset()
+    resilience._upstreams.clear()
+    user_status.invalidate()
+    reload_config()
+    yield cache
+    cache.clear()
+    cities._aliases.clear()
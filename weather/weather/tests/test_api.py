@@ -1,7 +1,36 @@
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+
 import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.http import QueryDict
+from django.utils import timezone
 from rest_framework import status
-from unittest.mock import patch
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import AccessToken
+from unittest.mock import Mock, call, patch
+
+import requests
+from api.authentication import StatelessJWTAuthentication, user_status
+from api.benchmarks import compare, parse_importtime, percentile
+from api.handlers import HandForecastsHandler
+from api.index import hand_forecast_index
 from api.models import HandForecasts
+from api.renderers import FastJSONRenderer
+from api.serializers import ForecastGetSerializer, ForecastRangeGetSerializer, QueryValidator
+from external_api.cities import city_key, mark_city_not_found, remember_city
+from external_api.forecast import DailyForecast
+from external_api.geocoding import save_location
+from external_api.openweathermap_client import OpenWeatherClient, OpenWeatherClientError
 
 pytestmark = pytest.mark.django_db
 
@@ -24,6 +53,49 @@ class TestCurrentWeatherView:
             assert response.data["temperature"] == 21.5
             assert response.data["local_time"] == "2025-06-07 14:00:00"
 
+    def test_upstream_calls_run_concurrently(self, api_client, user):
+        api_client.force_authenticate(user=user)
+        # Оба вызова ждут друг друга: при последовательном выполнении барьер не пройдет
+        barrier = threading.Barrier(2, timeout=5)
+
+        def weather(city):
+            barrier.wait()
+            return 18.0
+
+        def local_time(city):
+            barrier.wait()
+            return "12:30"
+
+        with patch("external_api.openweathermap_client.OpenWeatherClient.get_current_weather") as mock_weather, \
+                patch("external_api.worldtime_client.CityTimeClient.get_time") as mock_time:
+            mock_weather.side_effect = weather
+            mock_time.side_effect = local_time
+
+            response = api_client.get(self.url, {"city": "Moscow"})
+
+            assert response.status_code == status.HTTP_200_OK
+            assert response.data == {"temperature": 18.0, "local_time": "12:30"}
+
+    def test_busy_batch_pool_does_not_block_single_city(self, monkeypatch):
+        from concurrent.futures import ThreadPoolExecutor
+
+        from api.handlers import CurrentWeatherHandler
+
+        release = threading.Event()
+        busy_pool = ThreadPoolExecutor(max_workers=1)
+        busy_pool.submit(release.wait, 5)
+        monkeypatch.setattr("api.handlers._batch_executor", busy_pool)
+        caller = threading.get_ident()
+
+        try:
+            with patch("external_api.openweathermap_client.OpenWeatherClient.get_current_weather") as mock_weather, \
+                    patch("external_api.worldtime_client.CityTimeClient.get_time", return_value="12:30"):
+                mock_weather.side_effect = lambda city: threading.get_ident() == caller
+                assert CurrentWeatherHandler.get_current_weather("Moscow") == (True, "12:30")
+        finally:
+            release.set()
+            busy_pool.shutdown()
+
     def test_missing_city_param(self, api_client, user):
         api_client.force_authenticate(user=user)
 
@@ -56,6 +128,62 @@ class TestCurrentWeatherView:
             assert "error" in response.data
 
 
+@pytest.mark.django_db
+class TestCurrentWeatherBatchView:
+    url = "/api/weather/current/batch"
+
+    def test_batch(self, api_client, user):
+        api_client.force_authenticate(user=user)
+
+        def weather(city):
+            if city == "Nowhere":
+                raise OpenWeatherClientError("city not found")
+            return 15.0
+
+        with patch("external_api.openweathermap_client.OpenWeatherClient.get_cached_current_weather") as mock_cached, \
+                patch("external_api.openweathermap_client.OpenWeatherClient.get_current_weather") as mock_weather, \
+                patch("external_api.worldtime_client.CityTimeClient.get_time") as mock_time:
+            mock_cached.return_value = {"Moscow": 20.0}
+            mock_weather.side_effect = weather
+            mock_time.return_value = "10:00"
+
+            response = api_client.post(self.url, {"cities": ["Moscow", "Paris", "Nowhere", "Paris"]}, format="json")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["results"] == {
+            "Moscow": {"temperature": 20.0, "local_time": "10:00"},
+            "Paris": {"temperature": 15.0, "local_time": "10:00"},
+        }
+        assert response.data["errors"] == {"Nowhere": "Ошибка работы с API OpenWeather - city not found"}
+        mock_weather.assert_has_calls([call("Paris"), call("Nowhere")], any_order=True)
+        assert mock_weather.call_count == 2
+
+    def test_locations_and_not_found_marks_are_read_in_batch(self, api_client, user):
+        api_client.force_authenticate(user=user)
+        save_location("Moscow", 55.75, 37.61, "Europe/Moscow")
+        mark_city_not_found("Atlantis", "geocoding")
+
+        with patch("external_api.openweathermap_client.OpenWeatherClient.get_cached_current_weather") as mock_cached, \
+                patch("external_api.worldtime_client.get_cached_location") as mock_location, \
+                patch("external_api.worldtime_client.is_city_not_found") as mock_not_found:
+            mock_cached.return_value = {"Moscow": 20.0, "Atlantis": 1.0}
+            response = api_client.post(self.url, {"cities": ["Moscow", "Atlantis"]}, format="json")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert list(response.data["results"]) == ["Moscow"]
+        assert response.data["errors"] == {"Atlantis": "Ошибка работы с API WorldTime - Город 'Atlantis' не найден."}
+        mock_location.assert_not_called()
+        mock_not_found.assert_not_called()
+
+    def test_empty_batch(self, api_client, user):
+        api_client.force_authenticate(user=user)
+
+        response = api_client.post(self.url, {"cities": []}, format="json")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "cities" in response.data
+
+
 @pytest.mark.django_db
 class TestForecastView:
     forecast_url = "/api/weather/forecast"
@@ -132,3 +260,610 @@ class TestForecastView:
         forecast = HandForecasts.objects.get(city="Berlin", date="2025-06-10")
         assert forecast.min_temperature == 11.0
         assert forecast.max_temperature == 19.5
+
+
+@pytest.mark.django_db
+class TestForecastRangeView:
+    url = "/api/weather/forecast"
+
+    def test_hand_forecasts_override_api_data(self, api_client, user):
+        api_client.force_authenticate(user=user)
+        today = timezone.now().date()
+        days = [today + timedelta(days=offset) for offset in range(3)]
+        HandForecasts.objects.create(city="Moscow", date=days[1], min_temperature=-1.0, max_temperature=1.0)
+
+        with patch("external_api.openweathermap_client.OpenWeatherClient.get_forecast") as mock_forecast:
+            mock_forecast.return_value = DailyForecast.from_slots([
+                {"dt_txt": f"{day} 12:00:00", "main": {"temp": 15.0, "temp_min": 10.0, "temp_max": 20.0}}
+                for day in days
+            ])
+
+            response = api_client.get(self.url, {
+                "city": "Moscow",
+                "date_from": days[0].strftime("%d.%m.%Y"),
+                "date_to": days[2].strftime("%d.%m.%Y"),
+            })
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == [
+            {"date": str(days[0]), "min_temperature": 10.0, "max_temperature": 20.0},
+            {"date": str(days[1]), "min_temperature": -1.0, "max_temperature": 1.0},
+            {"date": str(days[2]), "min_temperature": 10.0, "max_temperature": 20.0},
+        ]
+        mock_forecast.assert_called_once()
+
+    def test_inverted_range(self, api_client, user):
+        api_client.force_authenticate(user=user)
+        today = timezone.now().date()
+
+        response = api_client.get(self.url, {
+            "city": "Moscow",
+            "date_from": (today + timedelta(days=2)).strftime("%d.%m.%Y"),
+            "date_to": today.strftime("%d.%m.%Y"),
+        })
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "date_from" in response.data
+
+
+@pytest.mark.django_db
+class TestForecastImportView:
+    url = "/api/weather/forecast/import"
+
+    def test_csv_import_upserts_rows(self, api_client, user):
+        api_client.force_authenticate(user=user)
+        date = timezone.now().date()
+        HandForecasts.objects.create(city="Berlin", date=date, min_temperature=0.0, max_temperature=1.0)
+        body = (
+            "city,date,min_temperature,max_temperature\n"
+            f"Berlin,{date:%d.%m.%Y},10.0,18.5\n"
+            f"Paris,{date:%d.%m.%Y},12.0,20.0\n"
+            f"Paris,{date:%d.%m.%Y},25.0,20.0\n"
+        )
+
+        response = api_client.post(self.url, body, content_type="text/csv")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["imported"] == 2
+        assert response.data["errors_total"] == 1
+        assert response.data["errors"][0]["row"] == 3
+        assert HandForecasts.objects.get(city="Berlin").max_temperature == 18.5
+        assert HandForecastsHandler.get_forecast("Paris", date) == {"min_temperature": 12.0, "max_temperature": 20.0}
+
+    def test_json_import(self, api_client, user):
+        api_client.force_authenticate(user=user)
+        date = (timezone.now().date() + timedelta(days=1)).strftime("%d.%m.%Y")
+        rows = [
+            {"city": "Oslo", "date": date, "min_temperature": 1.0, "max_temperature": 2.0},
+            {"city": "oslo", "date": date, "min_temperature": 3.0, "max_temperature": 4.0},
+        ]
+
+        response = api_client.post(self.url, rows, format="json")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["imported"] == 1
+        assert HandForecasts.objects.get().min_temperature == 3.0
+
+
+class TestHandForecastsHandler:
+
+    def test_forecast_is_found_by_any_city_spelling(self):
+        remember_city(524901, "Moscow", "Москва")
+        date = timezone.now().date()
+        HandForecastsHandler.save_forecast(" moscow", date, 1.0, 5.0)
+
+        assert HandForecastsHandler.get_forecast("Москва", date) == {"min_temperature": 1.0, "max_temperature": 5.0}
+        assert HandForecastsHandler.save_forecast("MOSCOW", date, 2.0, 6.0) is False
+        assert HandForecasts.objects.get().city_key == "id524901"
+
+    def test_forecast_moves_to_city_id_when_alias_is_learned(self):
+        date = timezone.now().date()
+        HandForecastsHandler.save_forecast("Moskva", date, 1.0, 5.0)
+        HandForecastsHandler.save_forecast("Moskva", date + timedelta(days=1), 2.0, 6.0)
+        HandForecastsHandler.save_forecast("Moscow", date + timedelta(days=1), 3.0, 7.0)
+        remember_city(524901, "Moscow")
+
+        remember_city(524901, "Moscow", "Moskva")
+
+        assert HandForecastsHandler.get_forecast("Moscow", date) == {"min_temperature": 1.0, "max_temperature": 5.0}
+        # На дату уже был прогноз с каноническим ключом: он остается
+        assert HandForecastsHandler.get_forecast("Moskva", date + timedelta(days=1))["min_temperature"] == 3.0
+        assert set(HandForecasts.objects.values_list("city_key", flat=True)) == {"id524901"}
+
+    def test_db_is_skipped_without_hand_forecast(self, django_assert_num_queries):
+        date = timezone.now().date()
+        HandForecastsHandler.save_forecast("Oslo", date, 1.0, 2.0)
+        hand_forecast_index.rebuild()
+
+        with django_assert_num_queries(0):
+            assert HandForecastsHandler.get_forecast("Oslo", date + timedelta(days=1)) is None
+        with django_assert_num_queries(1):
+            assert HandForecastsHandler.get_forecast("Oslo", date) == {"min_temperature": 1.0, "max_temperature": 2.0}
+
+    def test_index_fails_open_when_rebuild_fails(self):
+        date = timezone.now().date()
+        HandForecasts.objects.create(city="Oslo", city_key="oslo", date=date, min_temperature=1.0, max_temperature=2.0)
+
+        with patch.object(hand_forecast_index, "rebuild", side_effect=RuntimeError("redis down")):
+            assert HandForecastsHandler.get_forecast("Oslo", date) == {"min_temperature": 1.0, "max_temperature": 2.0}
+
+    @pytest.mark.parametrize("index_exists, expected", [(True, False), (False, True)])
+    def test_index_is_not_rebuilt_concurrently(self, index_exists, expected):
+        redis = Mock()
+        redis.exists.side_effect = lambda key: index_exists and key == "hand_forecasts:index"
+        redis.pipeline.return_value.execute.return_value = [False]
+        lock = Mock()
+        lock.acquire.return_value = False
+
+        # Блокировку держит другой процесс: прежний индекс используется, а без него прогноз считается возможным
+        with patch.object(hand_forecast_index, "_redis", return_value=redis), \
+                patch("api.index.cache.lock", return_value=lock, create=True):
+            assert hand_forecast_index.rebuild() is None
+            assert hand_forecast_index.might_exist(["oslo"], [timezone.now().date()]) is expected
+
+        redis.delete.assert_not_called()
+        redis.eval.assert_not_called()
+
+    def test_failed_index_write_keeps_forecast_visible(self):
+        redis = Mock()
+        redis.eval.side_effect = ConnectionError("redis down")
+        redis.exists.return_value = True
+        redis.pipeline.return_value.execute.return_value = [False]
+        lock = Mock()
+        lock.acquire.return_value = False
+        date = timezone.now().date()
+
+        with patch.object(hand_forecast_index, "_redis", return_value=redis), \
+                patch("api.index.cache.lock", return_value=lock, create=True):
+            HandForecastsHandler.save_forecast("Oslo", date, 1.0, 2.0)
+            redis.delete.assert_called_once_with("hand_forecasts:index:ready")
+            # Пока индекс не перестроен, прогноз считается возможным даже при существующем индексе
+            assert hand_forecast_index.might_exist(["oslo"], [date]) is True
+
+
+class TestRunBenchmarks:
+
+    def test_percentile(self):
+        values = [float(value) for value in range(1, 101)]
+
+        assert percentile(values, 50) == 50.0
+        assert percentile(values, 99) == 99.0
+        assert percentile([], 95) == 0.0
+
+    def test_compare_reports_regressions(self):
+        baseline = {"current_hot": {"throughput": 100.0, "p95_ms": 10.0, "p99_ms": 20.0}}
+        results = {"current_hot": {"throughput": 80.0, "p95_ms": 10.5, "p99_ms": 30.0}}
+
+        regressions = compare(results, baseline, threshold=0.1)
+
+        assert len(regressions) == 2
+        assert compare(results, baseline, threshold=0.6) == []
+
+    @pytest.mark.django_db(transaction=True)
+    def test_command_writes_report_and_compares(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("external_api.geocoding._geolocator", None)
+        output = tmp_path / "report.json"
+
+        # Тестовая sqlite в памяти не допускает параллельной записи, поэтому клиент один
+        with patch.dict(os.environ):
+            call_command(
+                "run_benchmarks", "--requests", "5", "--concurrency", "1", "--latency", "0",
+                "--workload", "current_hot", "--workload", "forecast_cold", "--workload", "forecast_post",
+                "--output", str(output)
+            )
+        report = json.loads(output.read_text(encoding="utf-8"))
+
+        # Данные локальных внешних API остаются под префиксом запуска
+        assert cache._cache and all(key.startswith("benchmark:") for key in cache._cache)
+        assert set(report["results"]) == {"current_hot", "forecast_cold", "forecast_post"}
+        for result in report["results"].values():
+            assert result["requests"] == 5
+            assert result["errors"] == 0
+
+        report["results"]["current_hot"]["throughput"] *= 1000
+        output.write_text(json.dumps(report), encoding="utf-8")
+        with patch.dict(os.environ), pytest.raises(CommandError):
+            call_command(
+                "run_benchmarks", "--requests", "5", "--concurrency", "1", "--latency", "0",
+                "--workload", "current_hot", "--baseline", str(output)
+            )
+
+    def test_command_refuses_shared_cache(self, settings, monkeypatch):
+        # Без сигнала setting_changed, чтобы не переключать кэш тестов
+        monkeypatch.setitem(settings.CACHES, "default", {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": "redis://cache.example.com:6379/1",
+        })
+
+        with pytest.raises(CommandError, match="Кэш"):
+            call_command("run_benchmarks", "--requests", "1")
+
+    def test_command_refuses_shared_db(self, settings):
+        settings.DATABASES = {**settings.DATABASES, "default": {
+            **settings.DATABASES["default"],
+            "ENGINE": "django.db.backends.postgresql",
+            "HOST": "db.example.com",
+        }}
+
+        with pytest.raises(CommandError, match="Бд"):
+            call_command("run_benchmarks", "--requests", "1")
+
+
+class TestMetricsView:
+    url = "/metrics"
+
+    def test_metrics_are_exposed(self, api_client):
+        date = timezone.now().date()
+        HandForecastsHandler.save_forecast("Oslo", date, 1.0, 2.0)
+
+        response = api_client.get(self.url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response["Content-Type"].startswith("text/plain; version=0.0.4")
+        assert f'weather_db_query_duration_seconds_count{{operation="save_forecast",pid="{os.getpid()}"}} 1' in response.content.decode()
+
+    def test_token_is_required_when_configured(self, api_client, env):
+        env(METRICS_TOKEN="secret")
+
+        assert api_client.get(self.url).status_code == status.HTTP_403_FORBIDDEN
+        assert api_client.get(self.url, HTTP_AUTHORIZATION="Bearer secret").status_code == status.HTTP_200_OK
+
+
+class TestServerTiming:
+    url = "/api/weather/current"
+
+    @pytest.fixture
+    def auth(self, user):
+        return f"Bearer {AccessToken.for_user(user)}"
+
+    def test_phases_are_reported(self, api_client, auth, user):
+        # Список пользователей уже загружен, как в работающем процессе
+        user_status.is_active(user.pk)
+        with patch("external_api.openweathermap_client.OpenWeatherClient.get_current_weather", return_value=21.5), \
+                patch("external_api.worldtime_client.CityTimeClient.get_time", return_value="14:00"):
+            response = api_client.get(self.url, {"city": "Moscow"}, HTTP_AUTHORIZATION=auth)
+
+        assert response.status_code == status.HTTP_200_OK
+        phases = [item.split(";")[0] for item in response["Server-Timing"].split(", ")]
+        assert phases == ["auth", "cache", "validation", "total"]
+
+    def test_profile_on_privileged_header(self, api_client, auth, env, tmp_path):
+        env(PROFILE_TOKEN="secret", PROFILE_DIR=str(tmp_path))
+
+        api_client.get(self.url, HTTP_AUTHORIZATION=auth)
+        assert list(tmp_path.iterdir()) == []
+
+        api_client.get(self.url, HTTP_AUTHORIZATION=auth, HTTP_X_PROFILE="secret")
+        profiles = list(tmp_path.iterdir())
+        assert len(profiles) == 1
+        assert profiles[0].name.endswith(".prof")
+        assert "-GET-api_weather_current-" in profiles[0].name
+
+
+class TestConditionalGet:
+    url = "/api/weather/forecast"
+
+    @staticmethod
+    def upstream_response(payload):
+        response = Mock(spec=requests.Response, status_code=200)
+        response.json.return_value = payload
+        return response
+
+    def forecast_payload(self):
+        today = timezone.now().date()
+        return {
+            "city": {"id": 3143244, "name": "Oslo"},
+            "list": [
+                {"dt_txt": f"{today + timedelta(days=offset)} 12:00:00",
+                 "main": {"temp": 5.0, "temp_min": 1.0, "temp_max": 9.0}}
+                for offset in range(3)
+            ],
+        }
+
+    def test_forecast_not_modified(self, api_client, user):
+        api_client.force_authenticate(user=user)
+        params = {"city": "Oslo", "date": (timezone.now().date() + timedelta(days=1)).strftime("%d.%m.%Y")}
+
+        with patch("requests.Session.get", return_value=self.upstream_response(self.forecast_payload())) as mock_get:
+            response = api_client.get(self.url, params)
+            etag = response["ETag"]
+            assert response.status_code == status.HTTP_200_OK
+            assert 0 < int(response["Cache-Control"].split("max-age=")[1]) <= 600
+            assert "Expires" in response
+
+            response = api_client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+            assert response.status_code == status.HTTP_304_NOT_MODIFIED
+            assert response["ETag"] == etag
+            assert response.content == b""
+
+            response = api_client.get(self.url, params, HTTP_IF_NONE_MATCH='W/"other"')
+            assert response.status_code == status.HTTP_200_OK
+
+        assert mock_get.call_count == 1
+
+    def test_refresh_with_same_data_keeps_etag(self, api_client, user):
+        api_client.force_authenticate(user=user)
+        params = {"city": "Oslo", "date": (timezone.now().date() + timedelta(days=1)).strftime("%d.%m.%Y")}
+
+        with patch("requests.Session.get", return_value=self.upstream_response(self.forecast_payload())):
+            etag = api_client.get(self.url, params)["ETag"]
+            OpenWeatherClient.get_forecast.refresh(OpenWeatherClient(), "Oslo")
+
+        response = api_client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_stale_entry_is_refreshed_instead_of_not_modified(self, api_client, user, env):
+        env(RESPONSE_CACHE_ENABLED="0", CACHE_STALE_TIMEOUT="600")
+        api_client.force_authenticate(user=user)
+        params = {"city": "Oslo", "date": (timezone.now().date() + timedelta(days=1)).strftime("%d.%m.%Y")}
+
+        with patch("requests.Session.get", return_value=self.upstream_response(self.forecast_payload())):
+            etag = api_client.get(self.url, params)["ETag"]
+
+        cache_key = f"daily_forecast:{city_key('Oslo')}"
+        cache.set(cache_key, {**cache.get(cache_key), "fresh_until": time.time() - 1})
+
+        with patch("external_api.decorators._refresh_in_background") as mock_refresh:
+            response = api_client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert "ETag" not in response
+        mock_refresh.assert_called_once()
+
+    def test_hand_forecast_change_changes_etag(self, api_client, user):
+        api_client.force_authenticate(user=user)
+        date = timezone.now().date()
+        params = {"city": "Oslo", "date": date.strftime("%d.%m.%Y")}
+        HandForecastsHandler.save_forecast("Oslo", date, 1.0, 2.0)
+
+        response = api_client.get(self.url, params)
+        etag = response["ETag"]
+        assert response["Cache-Control"] == "private, max-age=0"
+        assert api_client.get(self.url, params, HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_304_NOT_MODIFIED
+
+        HandForecastsHandler.save_forecast("Oslo", date, 3.0, 4.0)
+        response = api_client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response["ETag"] != etag
+
+    def test_current_weather_not_modified(self, api_client, user):
+        api_client.force_authenticate(user=user)
+        payload = {"id": 3143244, "name": "Oslo", "main": {"temp": 3.5}}
+
+        with patch("requests.Session.get", return_value=self.upstream_response(payload)), \
+                patch("external_api.worldtime_client.CityTimeClient.get_time", return_value="14:00"):
+            # Прогрев кэша в основном потоке: тестовая sqlite не допускает записи из потоков запроса
+            OpenWeatherClient().get_current_weather("Oslo")
+            response = api_client.get("/api/weather/current", {"city": "Oslo"})
+            assert 0 <= int(response["Cache-Control"].split("max-age=")[1]) <= 60
+
+            response = api_client.get("/api/weather/current", {"city": "Oslo"}, HTTP_IF_NONE_MATCH=response["ETag"])
+
+        # Версия меняется с каждой минутой, поэтому на границе минуты ответ может быть полным
+        assert response.status_code in (status.HTTP_304_NOT_MODIFIED, status.HTTP_200_OK)
+        assert "Authorization" in response["Vary"]
+
+
+class TestResponseCache:
+    url = "/api/weather/forecast"
+
+    def params(self):
+        return {"city": "Oslo", "date": timezone.now().date().strftime("%d.%m.%Y")}
+
+    def test_hit_skips_handlers_and_post_invalidates(self, api_client, user):
+        api_client.force_authenticate(user=user)
+        params = self.params()
+        HandForecastsHandler.save_forecast("Oslo", timezone.now().date(), 1.0, 2.0)
+
+        with patch("api.views.HandForecastsHandler.get_forecast", wraps=HandForecastsHandler.get_forecast) as mock_get:
+            first = api_client.get(self.url, params)
+            second = api_client.get(self.url, params)
+            assert mock_get.call_count == 1
+            assert second.status_code == status.HTTP_200_OK
+            assert second.content == first.content
+            assert second["ETag"] == first["ETag"]
+            assert second["Cache-Control"] == "private, max-age=0"
+
+            response = api_client.get(self.url, params, HTTP_IF_NONE_MATCH=first["ETag"])
+            assert response.status_code == status.HTTP_304_NOT_MODIFIED
+            assert mock_get.call_count == 1
+
+            response = api_client.post(self.url, {**params, "min_temperature": 3.0, "max_temperature": 4.0})
+            assert response.status_code == status.HTTP_200_OK
+
+            response = api_client.get(self.url, params)
+            assert mock_get.call_count == 2
+            assert response.json() == {"min_temperature": 3.0, "max_temperature": 4.0}
+
+    def test_hit_is_not_served_for_past_date(self, api_client, user):
+        api_client.force_authenticate(user=user)
+        params = self.params()
+        HandForecastsHandler.save_forecast("Oslo", timezone.now().date(), 1.0, 2.0)
+        assert api_client.get(self.url, params).status_code == status.HTTP_200_OK
+
+        with patch("django.utils.timezone.now", return_value=timezone.now() + timedelta(days=1)):
+            response = api_client.get(self.url, params)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_import_invalidates_range(self, api_client, user):
+        api_client.force_authenticate(user=user)
+        today = timezone.now().date()
+        params = {"city": "Oslo", "date_from": today.strftime("%d.%m.%Y"), "date_to": today.strftime("%d.%m.%Y")}
+        HandForecastsHandler.save_forecast("Oslo", today, 1.0, 2.0)
+        assert api_client.get(self.url, params).json()[0]["max_temperature"] == 2.0
+
+        HandForecastsHandler.import_forecasts([
+            {"city": "oslo", "date": today.strftime("%d.%m.%Y"), "min_temperature": 5.0, "max_temperature": 6.0}
+        ])
+        assert api_client.get(self.url, params).json()[0]["max_temperature"] == 6.0
+
+    def test_disabled(self, api_client, user, env):
+        env(RESPONSE_CACHE_ENABLED="0")
+        api_client.force_authenticate(user=user)
+        HandForecastsHandler.save_forecast("Oslo", timezone.now().date(), 1.0, 2.0)
+
+        with patch("api.views.HandForecastsHandler.get_forecast", wraps=HandForecastsHandler.get_forecast) as mock_get:
+            api_client.get(self.url, self.params())
+            api_client.get(self.url, self.params())
+
+        assert mock_get.call_count == 2
+
+
+class TestStatelessAuthentication:
+    url = "/api/weather/current"
+
+    def request(self, user):
+        return APIRequestFactory().get(self.url, HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+    def test_no_user_query_per_request(self, user, django_assert_num_queries):
+        authentication = StatelessJWTAuthentication()
+        with django_assert_num_queries(1):
+            authentication.authenticate(self.request(user))
+
+        with django_assert_num_queries(0):
+            token_user, _ = authentication.authenticate(self.request(user))
+        assert isinstance(token_user, TokenUser)
+        assert str(token_user.id) == str(user.pk)
+
+    def test_disabled_and_deleted_users_are_rejected(self, api_client, user):
+        auth = f"Bearer {AccessToken.for_user(user)}"
+        with patch("external_api.openweathermap_client.OpenWeatherClient.get_current_weather", return_value=21.5), \
+                patch("external_api.worldtime_client.CityTimeClient.get_time", return_value="14:00"):
+            assert api_client.get(self.url, {"city": "Moscow"}, HTTP_AUTHORIZATION=auth).status_code == status.HTTP_200_OK
+
+            user.is_active = False
+            user.save()
+            response = api_client.get(self.url, {"city": "Moscow"}, HTTP_AUTHORIZATION=auth)
+            assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+            user.is_active = True
+            user.save()
+            assert api_client.get(self.url, {"city": "Moscow"}, HTTP_AUTHORIZATION=auth).status_code == status.HTTP_200_OK
+
+            user.delete()
+            response = api_client.get(self.url, {"city": "Moscow"}, HTTP_AUTHORIZATION=auth)
+            assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_new_user_is_looked_up_once(self, user, django_assert_num_queries):
+        authentication = StatelessJWTAuthentication()
+        authentication.authenticate(self.request(user))
+
+        # Пользователь создан в другом процессе: сигнал сюда не приходит
+        with patch("api.authentication.user_status.invalidate"):
+            other = type(user).objects.create_user(username="other", password="testpass")
+        with django_assert_num_queries(0):
+            authentication.authenticate(self.request(user))
+        with django_assert_num_queries(1):
+            authentication.authenticate(self.request(other))
+        with django_assert_num_queries(0):
+            authentication.authenticate(self.request(other))
+
+    def test_status_expires_and_cache_is_bounded(self, user, env, monkeypatch):
+        env(AUTH_USERS_CACHE_TIMEOUT="0")
+        authentication = StatelessJWTAuthentication()
+        authentication.authenticate(self.request(user))
+
+        # Пользователь отключен в другом процессе: сигнал сюда не приходит
+        with patch("api.authentication.user_status.invalidate"):
+            type(user).objects.filter(pk=user.pk).update(is_active=False)
+        with pytest.raises(AuthenticationFailed):
+            authentication.authenticate(self.request(user))
+
+        env(AUTH_USERS_CACHE_TIMEOUT="30")
+        monkeypatch.setattr(user_status, "MAX_USERS", 2)
+        for user_id in range(1000, 1005):
+            user_status.is_active(user_id)
+        assert list(user_status._users) == ["1003", "1004"]
+
+
+class TestFastPaths:
+
+    @staticmethod
+    def query(**params):
+        query = QueryDict(mutable=True)
+        query.update(params)
+        return query
+
+    @pytest.mark.parametrize("offset, city, date", [
+        (1, "Moscow", None),
+        (1, "  Moscow ", None),
+        (0, "Moscow", "{day}"),
+        (1, "", "{day}"),
+        (1, "Moscow", "{day}x"),
+        (1, "Moscow", "31.02.2025"),
+        (1, "Moscow", "2025-06-10"),
+        (1, "Mos\x00cow", "{day}"),
+        (-1, "Moscow", "{day}"),
+        (11, "Moscow", "{day}"),
+        (10, "Moscow", "{day}"),
+        (1, None, "{day}"),
+    ])
+    def test_validator_matches_serializer(self, offset, city, date):
+        day = (timezone.now().date() + timedelta(days=offset)).strftime("%d.%m.%Y")
+        params = {"city": city, "date": date.format(day=day) if date else None}
+        query = self.query(**{name: value for name, value in params.items() if value is not None})
+
+        serializer = ForecastGetSerializer(data=query)
+        expected = (serializer.validated_data, None) if serializer.is_valid() else (None, serializer.errors)
+
+        assert QueryValidator(ForecastGetSerializer, ("date",)).validate(query) == expected
+
+    def test_range_order_error_is_kept(self):
+        today = timezone.now().date()
+        query = self.query(
+            city="Oslo",
+            date_from=(today + timedelta(days=2)).strftime("%d.%m.%Y"),
+            date_to=today.strftime("%d.%m.%Y")
+        )
+
+        data, errors = QueryValidator(ForecastRangeGetSerializer, ("date_from", "date_to")).validate(query)
+
+        assert data is None
+        assert errors == {"date_from": ["Начало периода не может быть позже его конца"]}
+
+    @pytest.mark.parametrize("orjson_available", [True, False])
+    def test_renderer_matches_drf(self, monkeypatch, orjson_available):
+        if not orjson_available:
+            monkeypatch.setattr("api.renderers.orjson", None)
+        data = {
+            "city": ["Обязательное поле."],
+            "date": timezone.now().date(),
+            "results": {"Moscow": {"temperature": 21.5, "local_time": "14:00"}},
+            "errors": {},
+        }
+
+        assert FastJSONRenderer().render(data) == JSONRenderer().render(data)
+
+    def test_microbenchmark_command(self):
+        output = StringIO()
+        call_command("run_microbenchmarks", "--number", "10", "--json", stdout=output)
+        results = json.loads(output.getvalue())
+
+        assert set(results) == {"validation", "render"}
+        assert all(result["fast_us"] > 0 for result in results.values())
+
+
+class TestStartup:
+
+    def test_parse_importtime(self):
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   geopy.util\n"
+            "import time:      3000 |       3120 | geopy\n"
+            "Traceback (most recent call last):\n"
+        )
+
+        assert parse_importtime(output) == {
+            "geopy.util": {"self_us": 120, "cumulative_us": 120},
+            "geopy": {"self_us": 3000, "cumulative_us": 3120},
+        }
+
+    def test_heavy_dependencies_are_not_imported_at_startup(self):
+        output = StringIO()
+        call_command("measure_startup", "--top", "100000", "--json", stdout=output)
+        result = json.loads(output.getvalue())
+
+        assert "weather.urls" in result["modules"]
+        assert not any(name.split(".")[0] in ("geopy", "timezonefinder") for name in result["modules"])
+        assert result["wall_ms"] > 0
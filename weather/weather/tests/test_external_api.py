@@ -0,0 +1,601 @@
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from io import StringIO
+from unittest.mock import Mock, patch
+from zoneinfo import ZoneInfo
+
+import pytest
+import requests
+from django.core.management import call_command
+
+from external_api.cities import (
+    CityNotFoundError,
+    city_key,
+    city_keys,
+    city_query,
+    is_city_not_found,
+    normalize_city,
+    remember_city
+)
+from external_api.decorators import cached_data
+from external_api.fake_upstream import FakeUpstreamServer
+from external_api.forecast import DailyForecast
+from external_api.geocoding import get_location, save_location
+from external_api.local_cache import LocalCache
+from external_api.metrics import CACHE_REQUESTS, UPSTREAM_DURATION, UPSTREAM_ERRORS, Histogram, render
+from external_api.models import CityLocation
+from external_api.openweathermap_client import OpenWeatherClient, OpenWeatherClientError
+from external_api.resilience import HEDGED_REQUESTS, CircuitBreaker, CircuitOpen, Upstream, get_upstream
+from external_api.sessions import get_session
+from external_api.timing import finish_request, phase, server_timing, start_request
+from external_api.warmup import top_cities, track_city
+from external_api.worldtime_client import CityTimeClient, CityTimeClientError
+
+pytestmark = pytest.mark.django_db
+
+
+class TestSessions:
+
+    def test_session_is_shared_per_host(self):
+        first = get_session("https://api.openweathermap.org/data/2.5")
+        second = get_session("https://api.openweathermap.org/geo/1.0")
+        other = get_session("https://api.api-ninjas.com/v1/worldtime")
+
+        assert first is second
+        assert first is not other
+
+    def test_client_uses_pooled_session_with_timeout(self, env):
+        env(OPENWEATHER_BASE_URL="https://api.openweathermap.org/data/2.5")
+        client = OpenWeatherClient()
+
+        with patch.object(client.session, "get") as mock_get:
+            mock_get.return_value.status_code = 200
+            mock_get.return_value.json.return_value = {"id": 3143244, "name": "Oslo", "main": {"temp": 3.5}}
+
+            assert OpenWeatherClient.get_current_weather.__wrapped__(client, "Oslo") == 3.5
+            assert mock_get.call_args.kwargs["timeout"] == (3.05, 10.0)
+
+
+@pytest.mark.django_db
+class TestGeocoding:
+
+    def test_city_is_geocoded_once(self, locmem_cache):
+        with patch("external_api.geocoding._get_geolocator") as mock_geolocator:
+            mock_geolocator.return_value.geocode.return_value = Mock(latitude=55.75, longitude=37.61)
+
+            assert get_location("Moscow")["latitude"] == 55.75
+            locmem_cache.clear()
+            assert get_location(" moscow ")["longitude"] == 37.61
+
+            assert mock_geolocator.return_value.geocode.call_count == 1
+            assert CityLocation.objects.filter(city="moscow").exists()
+
+    def test_preload_locations_command(self, tmp_path):
+        path = tmp_path / "cities.csv"
+        path.write_text(
+            "city,latitude,longitude,timezone\n"
+            "Berlin,52.52,13.40,Europe/Berlin\n"
+            "Paris,48.85,2.35,\n",
+            encoding="utf-8"
+        )
+
+        call_command("preload_locations", str(path))
+
+        with patch("external_api.geocoding._get_geolocator") as mock_geolocator:
+            assert get_location("Berlin") == {"latitude": 52.52, "longitude": 13.40, "timezone": "Europe/Berlin"}
+            assert get_location("paris")["timezone"] == ""
+            mock_geolocator.assert_not_called()
+
+    def test_preload_updates_known_city(self, tmp_path):
+        remember_city(524901, "Moscow")
+        save_location("Moscow", 1.0, 1.0, "")
+        path = tmp_path / "cities.csv"
+        path.write_text("city,latitude,longitude,timezone\nmoscow,55.75,37.61,Europe/Moscow\n", encoding="utf-8")
+
+        call_command("preload_locations", str(path))
+
+        assert get_location("Moscow") == {"latitude": 55.75, "longitude": 37.61, "timezone": "Europe/Moscow"}
+        assert list(CityLocation.objects.values_list("city", flat=True)) == ["id524901"]
+
+    def test_location_moves_to_city_id_when_alias_is_learned(self):
+        save_location("Moskva", 55.75, 37.61, "Europe/Moscow")
+        remember_city(524901, "Moscow", "Moskva")
+
+        assert CityLocation.objects.get().city == "id524901"
+        with patch("external_api.geocoding._get_geolocator") as mock_geolocator:
+            assert get_location("Moscow")["timezone"] == "Europe/Moscow"
+            mock_geolocator.assert_not_called()
+
+
+class TestCityTimeClient:
+    location = {"latitude": 55.75, "longitude": 37.61, "timezone": ""}
+
+    def test_offline_time_uses_known_timezone(self):
+        client = CityTimeClient()
+        location = dict(self.location, timezone="Asia/Tokyo")
+
+        with patch("external_api.worldtime_client.get_location", return_value=location), \
+                patch.object(client.session, "get") as mock_get:
+            local_time = client.get_time("Tokyo")
+
+        assert local_time == datetime.now(ZoneInfo("Asia/Tokyo")).strftime("%H:%M")
+        mock_get.assert_not_called()
+
+    def test_remote_fallback_when_timezone_unknown(self):
+        client = CityTimeClient()
+
+        with patch("external_api.worldtime_client.get_location", return_value=self.location), \
+                patch("external_api.worldtime_client.find_timezone", return_value=None), \
+                patch("external_api.worldtime_client.set_timezone") as mock_set_timezone, \
+                patch.object(client.session, "get") as mock_get:
+            mock_get.return_value.status_code = 200
+            mock_get.return_value.json.return_value = {
+                "timezone": "Europe/Moscow",
+                "datetime": "2025-06-07 14:05:31",
+            }
+
+            assert client.get_time("Moscow") == "14:05"
+            mock_set_timezone.assert_called_once_with("Moscow", "Europe/Moscow")
+
+
+class TestCachedData:
+
+    def test_concurrent_misses_call_upstream_once(self):
+        calls = []
+
+        class Client:
+            @cached_data("test_single_flight")
+            def get(self, city):
+                calls.append(city)
+                time.sleep(0.3)
+                return 10.0
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: Client().get("Moscow"), range(8)))
+
+        assert results == [10.0] * 8
+        assert calls == ["Moscow"]
+
+    def test_waiters_get_leader_error(self):
+        class Client:
+            @cached_data("test_single_flight_error")
+            def get(self, city):
+                time.sleep(0.3)
+                raise OpenWeatherClientError("city not found")
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(Client().get, "Nowhere") for _ in range(4)]
+
+        for future in futures:
+            with pytest.raises(OpenWeatherClientError):
+                future.result()
+
+    def test_stale_value_is_served_and_refreshed_in_background(self, locmem_cache):
+        values = iter([1.0, 2.0])
+
+        class Client:
+            @cached_data("test_stale", timeout=60, stale_timeout=60)
+            def get(self, city):
+                return next(values)
+
+        assert Client().get("Paris") == 1.0
+        locmem_cache.set("test_stale:paris", {"value": 1.0, "fresh_until": time.time() - 1})
+
+        assert Client().get("Paris") == 1.0
+        for _ in range(50):
+            if locmem_cache.get("test_stale:paris")["value"] == 2.0:
+                break
+            time.sleep(0.05)
+        assert Client().get("Paris") == 2.0
+
+    def test_local_cache_answers_before_redis(self, locmem_cache, monkeypatch, env):
+        env(CACHE_L1_ENABLED="1")
+        monkeypatch.setattr("external_api.local_cache._local_cache", None)
+        calls = []
+
+        class Client:
+            @cached_data("test_l1")
+            def get(self, city):
+                calls.append(city)
+                return 5.0
+
+        assert Client().get("Rome") == 5.0
+        locmem_cache.clear()
+        assert Client().get("Rome") == 5.0
+        assert calls == ["Rome"]
+
+    def test_local_cache_respects_redis_expiry(self, locmem_cache, monkeypatch, env):
+        env(CACHE_L1_ENABLED="1", CACHE_L1_TIMEOUT="3600")
+        monkeypatch.setattr("external_api.local_cache._local_cache", None)
+        values = iter([1.0, 2.0])
+
+        class Client:
+            @cached_data("test_l1_expiry", timeout=1, stale_timeout=0)
+            def get(self, city):
+                return next(values)
+
+        assert Client().get("Rome") == 1.0
+        time.sleep(1.1)
+        # Запись удалена из Redis по времени жизни: локальный кэш процесса ее тоже не отдает
+        assert Client().get("Rome") == 2.0
+
+    def test_get_cached_many(self):
+        class Client:
+            @cached_data("test_many")
+            def get(self, city):
+                return len(city)
+
+        client = Client()
+        client.get("Rome")
+        client.get("Oslo")
+
+        assert Client.get.get_cached_many(client, ["Rome", "Oslo", "Lima"]) == {"Rome": 4, "Oslo": 4}
+
+
+class TestLocalCache:
+
+    def test_least_recently_used_entry_is_evicted(self):
+        local_cache = LocalCache(max_entries=2, max_bytes=1024, timeout=60)
+        local_cache.set("a", 1)
+        local_cache.set("b", 2)
+        local_cache.get("a")
+        local_cache.set("c", 3)
+
+        assert local_cache.get("a") == 1
+        assert local_cache.get("b") is None
+        assert local_cache.get("c") == 3
+
+    def test_expired_and_oversized_entries_are_not_kept(self):
+        local_cache = LocalCache(max_entries=10, max_bytes=200, timeout=60)
+        local_cache.set("short", 1, timeout=0.01)
+        local_cache.set("big", "x" * 500)
+        time.sleep(0.02)
+
+        assert local_cache.get("short") is None
+        assert local_cache.get("big") is None
+
+
+class TestCities:
+
+    def test_normalize_city(self):
+        assert normalize_city("  New   York ") == "new york"
+        assert normalize_city("МОСКВА") == "москва"
+
+    def test_aliases_share_city_key(self):
+        assert city_key("Moskva") == "moskva"
+
+        remember_city(524901, "Moskva", "Moscow")
+
+        assert city_key(" moscow ") == city_key("MOSKVA") == "id524901"
+        assert city_query("Moskva") == {"id": 524901}
+        assert city_keys("Moskva") == ["id524901", "moskva"]
+
+
+class TestDailyForecast:
+    slots = [
+        {"dt_txt": "2025-06-10 18:00:00", "main": {"temp": 14.0, "temp_min": 13.5, "temp_max": 14.2}},
+        {"dt_txt": "2025-06-10 21:00:00", "main": {"temp": 11.0, "temp_min": 10.9, "temp_max": 11.3}},
+        {"dt_txt": "2025-06-11 00:00:00", "main": {"temp": 9.0, "temp_min": 8.75, "temp_max": 9.1}},
+        {"dt_txt": "2025-06-11 12:00:00", "main": {"temp": 21.0, "temp_min": 20.4, "temp_max": 24.5}},
+        {"dt_txt": "2025-06-11 15:00:00", "main": {"temp": 19.0, "temp_min": 18.0, "temp_max": 19.3}},
+    ]
+
+    def test_daily_aggregates(self):
+        forecast = DailyForecast.from_slots(self.slots)
+
+        assert len(forecast) == 2
+        assert forecast.get(date(2025, 6, 10)) == {"min_temperature": 10.9, "max_temperature": 14.2}
+        assert forecast.get(date(2025, 6, 11)) == {"min_temperature": 8.75, "max_temperature": 24.5}
+        assert forecast.get_mean(date(2025, 6, 11)) == 16.33
+        assert forecast.get(date(2025, 6, 12)) is None
+        assert forecast.get(date(2025, 6, 9)) is None
+
+    def test_pickle_roundtrip(self):
+        forecast = DailyForecast.from_slots(self.slots)
+
+        restored = pickle.loads(pickle.dumps(forecast))
+
+        assert restored.get(date(2025, 6, 11)) == forecast.get(date(2025, 6, 11))
+        assert len(pickle.dumps(forecast)) < 200
+
+
+class TestWarmCache:
+    base_url = "https://api.openweathermap.org/data/2.5"
+    responses = {
+        "weather": {"id": 3169070, "name": "Rome", "main": {"temp": 20.0}},
+        "forecast": {
+            "city": {"id": 3169070, "name": "Rome"},
+            "list": [{"dt_txt": "2025-06-10 12:00:00", "main": {"temp": 20.0, "temp_min": 18.0, "temp_max": 22.0}}],
+        },
+    }
+
+    def fake_get(self, url, **kwargs):
+        return Mock(status_code=200, json=Mock(return_value=self.responses[url.rsplit("/", 1)[1]]))
+
+    def test_refreshes_only_entries_close_to_expiry(self, env):
+        env(OPENWEATHER_BASE_URL=self.base_url)
+
+        with patch.object(get_session(self.base_url), "get", side_effect=self.fake_get) as mock_get:
+            OpenWeatherClient().get_current_weather("Rome")
+            mock_get.reset_mock()
+
+            with patch("external_api.management.commands.warm_cache.top_cities", return_value=["rome"]):
+                call_command("warm_cache", "--once", "--rate", "1000", stdout=StringIO())
+
+        assert [call.args[0].rsplit("/", 1)[1] for call in mock_get.call_args_list] == ["forecast"]
+        assert OpenWeatherClient.get_forecast.fresh_for("Rome") > 0
+
+    def test_track_city_counts_requests(self):
+        track_city("Rome")
+        track_city(" rome ")
+        track_city("Oslo")
+
+        assert top_cities(1) == ["rome"]
+
+
+class TestFakeUpstream:
+
+    @pytest.fixture
+    def upstream(self, env, monkeypatch):
+        server = FakeUpstreamServer(("127.0.0.1", 0))
+        server.start()
+        env(**server.env(), HTTP_RETRIES="0")
+        monkeypatch.setattr("external_api.geocoding._geolocator", None)
+        yield server
+        server.shutdown()
+        server.server_close()
+
+    def test_weather_and_forecast_through_real_client(self, upstream):
+        client = OpenWeatherClient()
+
+        temperature = client.get_current_weather("Moscow")
+        forecast = client.get_forecast("Moscow")
+
+        assert isinstance(temperature, float)
+        assert len(forecast) >= 5
+        assert city_key("Moscow") == "id524901"
+
+    def test_time_through_geocoder_and_worldtime(self, upstream, env):
+        env(TIME_RESOLUTION_MODE="remote")
+
+        local_time = CityTimeClient().get_time("Tokyo")
+
+        assert local_time == datetime.now(ZoneInfo("Asia/Tokyo")).strftime("%H:%M")
+        assert CityLocation.objects.get(city="tokyo").timezone == "Asia/Tokyo"
+
+    def test_unknown_city(self, upstream):
+        with pytest.raises(OpenWeatherClientError):
+            OpenWeatherClient().get_current_weather("Nowhere")
+        with pytest.raises(CityTimeClientError):
+            CityTimeClient().get_time("Nowhere")
+
+    def test_errors_and_rate_limit(self, upstream):
+        client = OpenWeatherClient()
+
+        upstream.rate_limit = 1
+        client.get_current_weather("Paris")
+        with pytest.raises(OpenWeatherClientError):
+            client.get_current_weather("Berlin")
+
+        upstream.rate_limit = 0
+        upstream.error_rate = 1
+        with pytest.raises(OpenWeatherClientError):
+            client.get_current_weather("Oslo")
+
+
+class TestMetrics:
+
+    def test_cache_hits_and_misses_per_prefix(self):
+        class Client:
+            @cached_data("test_metrics")
+            def get(self, city):
+                return 1.0
+
+        Client().get("Moscow")
+        Client().get("Moscow")
+        Client().get("moscow ")
+
+        assert CACHE_REQUESTS.get("test_metrics", "miss") == 1
+        assert CACHE_REQUESTS.get("test_metrics", "hit") == 2
+
+    def test_upstream_latency_and_errors(self):
+        client = OpenWeatherClient()
+
+        with patch.object(client.session, "get") as mock_get:
+            mock_get.return_value.status_code = 404
+            mock_get.return_value.json.return_value = {"message": "city not found"}
+            with pytest.raises(OpenWeatherClientError):
+                OpenWeatherClient.get_current_weather.__wrapped__(client, "Nowhere")
+
+            mock_get.side_effect = requests.ConnectionError()
+            with pytest.raises(OpenWeatherClientError):
+                OpenWeatherClient.get_current_weather.__wrapped__(client, "Oslo")
+
+        assert UPSTREAM_DURATION.count("openweather") == 2
+        assert UPSTREAM_ERRORS.get("openweather", "http_404") == 1
+        assert UPSTREAM_ERRORS.get("openweather", "ConnectionError") == 1
+
+    def test_histogram_text_format(self):
+        histogram = Histogram("test_duration_seconds", "Тест", ("operation",), buckets=(0.1, 1.0))
+        histogram.observe(0.05, "read")
+        histogram.observe(0.5, "read")
+        histogram.observe(5, "read")
+
+        text = render()
+        pid = f'pid="{os.getpid()}"'
+
+        assert "# TYPE test_duration_seconds histogram" in text
+        assert f'test_duration_seconds_bucket{{operation="read",le="0.1",{pid}}} 1' in text
+        assert f'test_duration_seconds_bucket{{operation="read",le="1.0",{pid}}} 2' in text
+        assert f'test_duration_seconds_bucket{{operation="read",le="+Inf",{pid}}} 3' in text
+        assert f'test_duration_seconds_count{{operation="read",{pid}}} 3' in text
+
+
+class TestTiming:
+
+    def test_phases_from_worker_threads_are_collected(self):
+        from api.handlers import CurrentWeatherHandler
+
+        def work(city):
+            with phase("openweather"):
+                time.sleep(0.01)
+
+        token = start_request()
+        with patch.object(OpenWeatherClient, "get_current_weather", side_effect=work), \
+                patch.object(CityTimeClient, "get_time", side_effect=work):
+            CurrentWeatherHandler.get_current_weather("Moscow")
+        timings = finish_request(token)
+
+        assert timings["openweather"][1] == 2
+        assert timings["openweather"][0] >= 0.02
+        assert server_timing(timings, 0.05).endswith("total;dur=50.0")
+
+    def test_phase_outside_request_is_ignored(self):
+        with phase("cache"):
+            pass
+
+
+class TestResilience:
+
+    def test_breaker_opens_fails_fast_and_recovers(self):
+        breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=0.2)
+
+        for _ in range(2):
+            breaker.before_call()
+            breaker.record(failed=True)
+        with pytest.raises(CircuitOpen):
+            breaker.before_call()
+
+        time.sleep(0.25)
+        breaker.before_call()
+        # Пока идет пробный запрос, остальные отклоняются
+        with pytest.raises(CircuitOpen):
+            breaker.before_call()
+        breaker.record(failed=False)
+
+        assert not breaker.is_open
+        breaker.before_call()
+
+    def test_client_fails_fast_when_upstream_is_down(self, env):
+        env(CIRCUIT_FAILURE_THRESHOLD="2")
+        client = OpenWeatherClient()
+
+        with patch.object(client.session, "get") as mock_get:
+            mock_get.return_value = Mock(spec=requests.Response, status_code=503)
+            mock_get.return_value.json.return_value = {"message": "service unavailable"}
+            for _ in range(3):
+                with pytest.raises(OpenWeatherClientError):
+                    OpenWeatherClient.get_current_weather.__wrapped__(client, "Oslo")
+
+        assert mock_get.call_count == 2
+        assert get_upstream("openweather").breaker.is_open
+
+    def test_not_found_does_not_open_breaker(self, env):
+        env(CIRCUIT_FAILURE_THRESHOLD="1")
+        client = OpenWeatherClient()
+
+        with patch.object(client.session, "get") as mock_get:
+            mock_get.return_value = Mock(spec=requests.Response, status_code=404)
+            mock_get.return_value.json.return_value = {"message": "city not found"}
+            with pytest.raises(OpenWeatherClientError):
+                OpenWeatherClient.get_current_weather.__wrapped__(client, "Nowhere")
+
+        assert not get_upstream("openweather").breaker.is_open
+
+    def test_hedged_request_replaces_failed_primary(self, env):
+        env(HEDGE_ENABLED="1", HEDGE_MIN_DELAY="0.05")
+        upstream = Upstream("test_hedge", hedge=True)
+        upstream._latencies.extend([0.01] * Upstream.min_samples)
+        caller = threading.get_ident()
+        threads = []
+
+        def send():
+            threads.append(threading.get_ident())
+            if len(threads) == 1:
+                time.sleep(0.2)
+                raise requests.ConnectionError()
+            return "hedge"
+
+        assert upstream.call(send) == "hedge"
+        # Основной запрос выполняется в потоке вызывающего, повторный - в пуле
+        assert threads[0] == caller and threads[1] != caller
+        assert HEDGED_REQUESTS.get("test_hedge", "hedge") == 1
+
+    def test_fast_primary_is_not_hedged(self, env):
+        env(HEDGE_ENABLED="1", HEDGE_MIN_DELAY="0.05")
+        upstream = Upstream("test_hedge", hedge=True)
+        upstream._latencies.extend([0.01] * Upstream.min_samples)
+        send = Mock(return_value="primary")
+
+        assert upstream.call(send) == "primary"
+        time.sleep(0.1)
+        assert send.call_count == 1
+
+
+class TestNegativeCache:
+
+    def test_not_found_is_cached_per_client(self):
+        weather_client = OpenWeatherClient()
+        time_client = CityTimeClient()
+
+        with patch.object(weather_client.session, "get") as mock_get, \
+                patch("external_api.worldtime_client.get_location", return_value=None) as mock_location:
+            mock_get.return_value.status_code = 404
+            mock_get.return_value.json.return_value = {"message": "city not found"}
+
+            for _ in range(3):
+                with pytest.raises(OpenWeatherClientError) as error:
+                    weather_client.get_current_weather("Nowhre")
+                assert str(error.value) == "Ошибка API: city not found"
+                with pytest.raises(CityTimeClientError):
+                    time_client.get_time(" nowhre")
+
+        assert isinstance(error.value, CityNotFoundError)
+        assert mock_get.call_count == 1
+        assert mock_location.call_count == 1
+
+    def test_geocoder_miss_does_not_block_openweather(self):
+        with patch("external_api.worldtime_client.get_location", return_value=None):
+            with pytest.raises(CityTimeClientError):
+                CityTimeClient().get_time("Oslo")
+
+        client = OpenWeatherClient()
+        with patch.object(client.session, "get") as mock_get:
+            mock_get.return_value.status_code = 200
+            mock_get.return_value.json.return_value = {"id": 3143244, "name": "Oslo", "main": {"temp": 3.5}}
+            assert client.get_current_weather("Oslo") == 3.5
+
+        assert is_city_not_found("Oslo", "geocoding")
+        assert not is_city_not_found("Oslo", "openweather")
+
+    def test_known_city_skips_not_found_check(self):
+        save_location("Moscow", 55.75, 37.61, "Europe/Moscow")
+
+        with patch("external_api.worldtime_client.is_city_not_found") as mock_not_found:
+            assert CityTimeClient().get_time("Moscow")
+
+        mock_not_found.assert_not_called()
+
+    def test_not_found_entry_expires(self, env):
+        env(CITY_NOT_FOUND_CACHE_TIMEOUT="1")
+
+        with patch("external_api.worldtime_client.get_location", return_value=None):
+            with pytest.raises(CityTimeClientError):
+                CityTimeClient().get_time("Nowhere")
+
+        assert is_city_not_found("nowhere", "geocoding")
+        time.sleep(1.1)
+        assert not is_city_not_found("nowhere", "geocoding")
+
+    def test_connection_errors_are_not_cached(self):
+        client = OpenWeatherClient()
+
+        with patch.object(client.session, "get", side_effect=requests.ConnectionError()):
+            with pytest.raises(OpenWeatherClientError):
+                client.get_current_weather("Oslo")
+
+        assert not is_city_not_found("Oslo", "openweather")